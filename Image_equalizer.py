@@ -1,13 +1,40 @@
 import sys
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget,QLabel,
-                             QHBoxLayout,QGridLayout,QPushButton,QSlider, QComboBox,QCheckBox,QGroupBox,QFileDialog,QProgressBar,QSpacerItem,QSizePolicy)
-from PyQt5.QtCore import Qt,QRect,QThread, pyqtSignal, QObject,QCoreApplication
-from PyQt5.QtGui import QPixmap,QImage,QColor, QPen,QPainter
-from PIL import Image,ImageEnhance
+import hashlib
 import os
-import numpy as np
+from collections import OrderedDict
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget,QLabel,
+                             QHBoxLayout,QGridLayout,QPushButton,QSlider, QComboBox,QCheckBox,QGroupBox,QFileDialog,QProgressBar,QSpacerItem,QSizePolicy,
+                             QScrollArea,QSpinBox)
+from PyQt5.QtCore import Qt,QRect,QThread, pyqtSignal, QObject
+from PyQt5.QtGui import QPixmap,QColor, QPen,QPainter
+from PIL import ImageEnhance
 import globals
-from adjustable_label import AdjustableLabel
+import fft_backend
+import frame_stream
+import instrumentation
+import mixer
+import region_sweep
+from adjustable_label import AdjustableLabel, array_to_qimage
+from ingestion import IngestionPool
+from mixing_worker import MixingWorker
+from spectrum_cache import SpectrumCache
+from stream_player import StreamPlayer
+from timing_overlay import TimingOverlay
+from workspace import Workspace
+
+# Resized images and spectra kept for re-ingestion
+INGEST_CACHE_SIZE = 8
+
+# Spectrum window (rows, columns) mixed for the live preview while dragging a slider
+PREVIEW_SHAPE = (200, 300)
+
+
+def image_hash(image):
+    """Content hash of a grayscale Pillow image."""
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(repr(image.size).encode())
+    return digest.hexdigest()
+
 
 class ImageEqualizer(QMainWindow):
     def __init__(self):
@@ -18,7 +45,40 @@ class ImageEqualizer(QMainWindow):
         self.smallest_height = None
         self.image_labels=[]  # Store all image labels for resizing
         self.combos=[]
-        
+        self.component_sliders=[]
+        self.image_paths = [None] * globals.input_count
+
+        # Ingestion state: content hash of each upload, what each slot currently shows,
+        # and recently resized images and spectra keyed by (hash, size, spectrum settings)
+        self.image_hashes = [None] * globals.input_count
+        self.ingested_keys = [None] * globals.input_count
+        self.ingest_cache = OrderedDict()
+
+        # Inputs being resampled and transformed in parallel, by the key they will have
+        self.pending_keys = [None] * globals.input_count
+        self.ingest_total, self.ingest_done = 0, 0
+        self.remix_after_ingest = False
+        self.awaited_generation = None  # Mix submitted to the worker and not displayed yet
+        self.ingestion_pool = IngestionPool(self)
+        self.ingestion_pool.ready.connect(self.finish_ingest)
+
+        # Spectra computed in earlier runs, and the last session
+        self.spectrum_cache = SpectrumCache.from_environment()
+
+        # Scratch buffers reused by the mixing and display pipeline
+        self.workspace = Workspace(allocator=globals.spill.empty)
+
+        # Background mixing thread, shared across resets
+        self.mixing_worker = MixingWorker(self, self.workspace)
+        self.mixing_worker.progress.connect(self.update_mixing_progress)
+        self.mixing_worker.result_ready.connect(self.display_mixed_image)
+
+        # Frame-sequence playback of the current mix, into the output selected when it started
+        self.stream_player = StreamPlayer(self)
+        self.stream_player.frame_ready.connect(self.display_stream_frame)
+        self.stream_player.finished.connect(self.stream_finished)
+        self.stream_output = None
+
         self.initUi()
        
 
@@ -29,21 +89,45 @@ class ImageEqualizer(QMainWindow):
         self.setCentralWidget(main_window)
 
 
-        for i in range(4):
+        if globals.input_count <= 4:
+            # Two columns of input viewers above the output and the controls
+            inputs_layout = container
+            columns = 2
+            controls_row = (globals.input_count + 1) // 2
+        else:
+            # More inputs scroll in four columns above the output and the controls
+            inputs_widget = QWidget()
+            inputs_layout = QGridLayout(inputs_widget)
+            inputs_scroll = QScrollArea()
+            inputs_scroll.setWidgetResizable(True)
+            inputs_scroll.setWidget(inputs_widget)
+            container.addWidget(inputs_scroll, 0, 0, 1, 2)
+            columns = 4
+            controls_row = 1
+
+        for i in range(globals.input_count):
             groupBox=self.create_input_viewer(f"Image {i+1}",i)
-            container.addWidget(groupBox,i//2,i%2)
+            inputs_layout.addWidget(groupBox,i//columns,i%columns)
 
         output_viewer=self.create_output_viewer()
-        container.addWidget(output_viewer,2,0)
+        container.addWidget(output_viewer,controls_row,0)
         
 
         mixer_controls=self.create_mixer_controls()
-        container.addWidget(mixer_controls,2,1)
+        container.addWidget(mixer_controls,controls_row,1)
         container.setColumnStretch(0,1)
         container.setColumnStretch(1,1)
 
         self.update_modes()
 
+        # Report which FFT backend the transforms run on
+        self.statusBar().showMessage(f"FFT backend: {fft_backend.describe()}")
+
+        # Per-stage timings, drawn over the viewers while enabled
+        self.timing_overlay = TimingOverlay(main_window, self.workspace)
+        self.timing_overlay.set_active(instrumentation.enabled)
+        self.timing_box.setChecked(instrumentation.enabled)
+
         # Styling
         self.setStyleSheet("""
             QLabel{
@@ -81,6 +165,7 @@ class ImageEqualizer(QMainWindow):
         image_label.setStyleSheet("background-color: lightgray; border: 1px solid black;")
         image_label.setAlignment(Qt.AlignCenter)
         image_label.mouseDoubleClickEvent = lambda event: self.upload_image(image_label,index)
+        image_label.workspace = self.workspace
 
         self.image_labels.append(image_label)  # Add to the list for later resizing
 
@@ -88,6 +173,7 @@ class ImageEqualizer(QMainWindow):
         ft_label = AdjustableLabel("FT Component Viewer")
         ft_label.setStyleSheet("background-color: black; border: 1px solid black;")
         ft_label.setAlignment(Qt.AlignCenter)
+        ft_label.workspace = self.workspace
 
         globals.ft_labels.append(ft_label)
 
@@ -95,6 +181,9 @@ class ImageEqualizer(QMainWindow):
         ft_selector = QComboBox()
         ft_selector.addItems(["Magnitude", "Phase", "Real", "Imaginary"])
         ft_selector.currentIndexChanged.connect(
+        lambda _: globals.spectra.components.__setitem__(index, ft_selector.currentText())
+        )
+        ft_selector.currentIndexChanged.connect(
         lambda _, label=ft_label: label.plot_ft_component(ft_selector.currentText(), index)
         )
         ft_selector.currentIndexChanged.connect(self.apply_mixing)
@@ -109,10 +198,18 @@ class ImageEqualizer(QMainWindow):
         component_slider.setRange(0, 100)  # Slider range from 0% to 100%
         component_slider.setValue(0)  # Default weight is 25%
         component_slider.valueChanged.connect(lambda: self.update_slider_value(index, component_slider.value(),"first"))
+        component_slider.valueChanged.connect(self.preview_mixing)  # Live low-res preview while dragging
         component_slider.sliderReleased.connect(self.apply_mixing)
+        self.component_sliders.append(component_slider)
+
+        # Frame directories cannot be picked in the file dialog of a double-click
+        frames_button = QPushButton("Frames")
+        frames_button.setToolTip("Load a directory of numbered frames")
+        frames_button.clicked.connect(lambda: self.upload_frames(image_label, index))
 
         hor_layout1.addWidget(title_label)
         hor_layout1.addWidget(ft_selector)
+        hor_layout1.addWidget(frames_button)
 
         # Arrange components
         hor_layout2.addWidget(image_label)
@@ -202,6 +299,23 @@ class ImageEqualizer(QMainWindow):
         self.region_size_slider.setValue(50)  # Default 50%
         self.region_size_slider.sliderReleased.connect(self.apply_mixing)
 
+        # Half-spectrum (rfft2) processing for real images
+        self.half_spectrum_box = QCheckBox("Half spectrum")
+        self.half_spectrum_box.setChecked(globals.half_spectrum)
+        self.half_spectrum_box.stateChanged.connect(self.toggle_half_spectrum)
+        region_layout.addWidget(self.half_spectrum_box)
+
+        # Single-precision (complex64) spectra and mixing
+        self.single_precision_box = QCheckBox("Single precision")
+        self.single_precision_box.setChecked(globals.single_precision)
+        self.single_precision_box.stateChanged.connect(self.toggle_single_precision)
+        region_layout.addWidget(self.single_precision_box)
+
+        # Record per-stage timings and show them over the viewers
+        self.timing_box = QCheckBox("Timing overlay")
+        self.timing_box.stateChanged.connect(lambda state: self.timing_overlay.set_active(state == Qt.Checked))
+        region_layout.addWidget(self.timing_box)
+
         regions_slider_layout=QHBoxLayout()
         regions_slider_layout.addLayout(region_layout)
         regions_slider_layout.addWidget(self.region_size_slider)
@@ -220,10 +334,32 @@ class ImageEqualizer(QMainWindow):
         reset_button=QPushButton("Reset")
         reset_button.setMaximumWidth(120)
         reset_button.clicked.connect(self.reset)
+        restore_button=QPushButton("Restore session")
+        restore_button.setMaximumWidth(180)
+        restore_button.clicked.connect(self.restore_session)
+        # Sessions live in the spectrum cache, which is only there with IMAGE_EQUALIZER_CACHE_DIR
+        restore_button.setVisible(self.spectrum_cache is not None)
+        export_timings_button=QPushButton("Export timings")
+        export_timings_button.setMaximumWidth(160)
+        export_timings_button.clicked.connect(self.export_timings)
+
+        # Mix the inputs' frame sequences with the current settings at a target frame rate
+        self.play_button=QPushButton("Play sequences")
+        self.play_button.setMaximumWidth(180)
+        self.play_button.setCheckable(True)
+        self.play_button.toggled.connect(self.toggle_stream)
+        self.fps_box=QSpinBox()
+        self.fps_box.setRange(1, 120)
+        self.fps_box.setValue(24)
+        self.fps_box.setSuffix(" fps")
 
         buttons_layout=QHBoxLayout()
         # buttons_layout.addWidget(apply_button)
         buttons_layout.addWidget(reset_button)
+        buttons_layout.addWidget(restore_button)
+        buttons_layout.addWidget(export_timings_button)
+        buttons_layout.addWidget(self.play_button)
+        buttons_layout.addWidget(self.fps_box)
 
 
         controls_layout.addWidget(outputs_menu)
@@ -241,6 +377,7 @@ class ImageEqualizer(QMainWindow):
 
         self.region_selector.currentIndexChanged.connect(self.update_regions)
         self.region_size_slider.valueChanged.connect(self.update_regions)
+        self.region_size_slider.valueChanged.connect(self.scrub_region)
 
         return group_box
         
@@ -248,48 +385,132 @@ class ImageEqualizer(QMainWindow):
         """Open a file dialog to upload an image, convert it to grayscale, and resize all labels."""
         options = QFileDialog.Options()
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Select Image File", "", "Image Files (*.png *.jpg *.jpeg *.bmp *.gif)", options=options
+            self, "Select Image File", "",
+            "Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff *.npy)", options=options
         )
         if file_path:
-            # Convert image to grayscale using Pillow
-            image = Image.open(file_path).convert("L")
-            width, height = image.size
+            self.load_input(index, file_path)
+
+    def upload_frames(self, label, index):
+        """Open a directory dialog to upload a directory of numbered frames as input index."""
+        directory = QFileDialog.getExistingDirectory(self, "Select Frame Directory")
+        if directory:
+            self.load_input(index, directory)
 
-            print(f"Uploaded image dimensions: {width}x{height}")  # Debugging print
+    def load_input(self, index, file_path):
+        """Show the first frame of an image or frame sequence in input index and transform it."""
+        if file_path:
+            # Decode and convert to grayscale in memory; sequences show their first frame
+            try:
+                with instrumentation.span("decode"):
+                    image = frame_stream.open_frame(file_path).convert("L")
+            except (OSError, ValueError) as e:
+                print(f"Cannot open {file_path}: {e}")
+                return
+            width, height = image.size
 
-            # Save temporarily in memory to convert to QPixmap
-            temp_path = "temp_grayscale.png"
-            image.save(temp_path)
+            instrumentation.log("Uploaded image dimensions: %dx%d", width, height)
 
             # Add the new image to the list of uploaded images
             if not hasattr(self, 'uploaded_images'):
-                self.uploaded_images = [None] * 4  # Initialize a list to store uploaded images
+                self.uploaded_images = [None] * globals.input_count  # Initialize a list to store uploaded images
             self.uploaded_images[index] = image
+            self.image_hashes[index] = image_hash(image)
+            self.image_paths[index] = file_path
 
             # Update the smallest dimensions across all uploaded images
             self.update_smallest_dimensions()
 
-            # Resize all uploaded images to the smallest dimensions
+            # Only the new image and images whose target size changed are recomputed,
+            # in parallel, each appearing as soon as it is ready
             for i, img in enumerate(self.uploaded_images):
-                if img is not None:  # Resize only if an image is present
-                    resized_image = img.resize((self.smallest_width, self.smallest_height), Image.Resampling.LANCZOS)
-
-                    # Update the label's image
-                    if isinstance(self.image_labels[i], AdjustableLabel):
-                        self.image_labels[i].set_image(resized_image, i)
-
-                    # Load as QPixmap
-                    resized_temp_path = f"temp_resized_{i}.png"
-                    resized_image.save(resized_temp_path)
-                    pixmap = QPixmap(resized_temp_path)
-                    os.remove(resized_temp_path)  # Clean up temporary file
-
-                    # Resize pixmap to fit the smallest dimensions
-                    pixmap = pixmap.scaled(
-                        self.smallest_width, self.smallest_height, Qt.KeepAspectRatio, Qt.SmoothTransformation
-                    )
-                    self.image_labels[i].setPixmap(pixmap)
-                    self.resize_all_labels()
+                if img is not None:
+                    self.ingest(i)
+
+    def ingest(self, i):
+        """Resize uploaded image i to the common size and transform it, reusing cached work.
+
+        Cached results are applied right away; anything else is prepared on the
+        ingestion pool and applied by finish_ingest when it is ready. Returns
+        False if the slot already shows (or is preparing) this image at this
+        size with the current spectrum settings.
+        """
+        target_size = (self.smallest_width, self.smallest_height)
+        key = (self.image_hashes[i], target_size, globals.half_spectrum, globals.single_precision)
+        if key in (self.ingested_keys[i], self.pending_keys[i]) or not isinstance(self.image_labels[i], AdjustableLabel):
+            return False
+
+        if key in self.ingest_cache:
+            self.ingest_cache.move_to_end(key)
+            resized_image, ft_image = self.ingest_cache[key]
+            self.pending_keys[i] = None
+            self.apply_ingested(i, key, resized_image, ft_image)
+            return True
+
+        # Spectra computed in an earlier run are memory-mapped back in
+        cache_name = None
+        if self.spectrum_cache is not None:
+            cache_name = self.spectrum_cache.entry_name(*key)
+            result = self.spectrum_cache.load(cache_name)
+            if result is not None:
+                self.pending_keys[i] = None
+                self.apply_ingested(i, key, result["image"], result["ft_image"], result["components"])
+                return True
+
+        if not any(self.pending_keys):
+            self.ingest_total, self.ingest_done = 0, 0
+            self.progress_bar.setValue(0)
+        self.ingest_total += 1
+        self.pending_keys[i] = key
+        self.ingestion_pool.submit(i, key, self.uploaded_images[i], target_size,
+                                   globals.half_spectrum, globals.single_precision,
+                                   self.spectrum_cache, cache_name)
+        return True
+
+    def finish_ingest(self, i, key, result):
+        """Apply a prepared input from the ingestion pool, unless it has been superseded."""
+        if key != self.pending_keys[i]:
+            return
+        self.pending_keys[i] = None
+        self.ingest_done += 1
+        self.progress_bar.setValue(int(100 * self.ingest_done / max(self.ingest_total, 1)))
+
+        if result is not None:
+            self.apply_ingested(i, key, result["image"], result["ft_image"], result["components"])
+        self.remix_when_ingested()
+
+    def remix_when_ingested(self):
+        """Run the mix deferred until every input is ingested, once none is pending."""
+        if self.remix_after_ingest and not any(self.pending_keys):
+            self.remix_after_ingest = False
+            self.apply_mixing()
+
+    def apply_ingested(self, i, key, resized_image, ft_image, components=None):
+        """Show a resized image and its spectrum in slot i and remember them in the cache."""
+        if globals.spectra.loaded[i] and self.awaited_generation is not None:
+            # The stack row is overwritten in place while the worker may still be reading it
+            # for that mix: drop the mix and run it again on the new spectrum
+            self.mixing_worker.supersede()
+            self.awaited_generation = None
+            self.remix_after_ingest = True
+
+        # Size the label first so the image is displayed straight from its pixel buffer
+        label = self.image_labels[i]
+        label.setFixedSize(*key[1])
+        label.set_image(resized_image, i, ft_image, components)
+
+        # set_image shows the magnitude; keep the viewer on the selected component
+        component = self.combos[i].currentText()
+        if component != "Magnitude":
+            label.plot_ft_component(component, i)
+
+        # The stack row is overwritten by later uploads, so the cache keeps its own spectrum
+        self.ingest_cache[key] = (resized_image, globals.spill.adopt(ft_image))
+        while len(self.ingest_cache) > INGEST_CACHE_SIZE:
+            self.ingest_cache.popitem(last=False)
+        self.ingested_keys[i] = key
+        self.remix_when_ingested()
+
     # def upload_image(self, label,index):
     #     """Open a file dialog to upload an image, convert it to grayscale, and resize all labels."""
     #     options = QFileDialog.Options()
@@ -357,259 +578,228 @@ class ImageEqualizer(QMainWindow):
     #     if self.smallest_height is None or height < self.smallest_height:
     #         self.smallest_height = height
 
-    def resize_all_labels(self):
-        """Resize all image labels to match the smallest dimensions."""
-        for label in self.image_labels:
-            pixmap = label.pixmap()
-            if pixmap:  # Resize only if an image has been uploaded
-                print(f"Resizing label to: {self.smallest_width}x{self.smallest_height}")  # Debugging print
-                resized_pixmap = pixmap.scaled(
-                    self.smallest_width, self.smallest_height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
-                )
-                label.setPixmap(resized_pixmap)
-                label.setFixedSize(self.smallest_width, self.smallest_height)  # Adjust QLabel size
-                print(f"Label size after resizing: {label.size().width()}x{label.size().height()}")
+    def toggle_half_spectrum(self, state):
+        """Switch between full and half-spectrum processing and recompute the loaded spectra."""
+        globals.half_spectrum = state == Qt.Checked
+        self.recompute_spectra()
+
+    def toggle_single_precision(self, state):
+        """Switch between double and single-precision processing and recompute the loaded spectra."""
+        globals.single_precision = state == Qt.Checked
+        self.recompute_spectra()
+
+    def recompute_spectra(self):
+        """Recompute (or fetch from the cache) and redisplay the spectra of all loaded images, then remix."""
+        for i, img in enumerate(getattr(self, 'uploaded_images', [])):
+            if img is not None:
+                self.ingest(i)
+
+        if any(self.pending_keys):
+            self.remix_after_ingest = True  # finish_ingest remixes once every input is ready
+        else:
+            self.apply_mixing()
 
     def update_slider_value(self, index, value,which):
         """Update the slider value for the given image index."""
         if which=="first":
-            globals.ft_sliders[index] = value / 100.0  # Normalize to range [0, 1]
+            globals.spectra.weights[index] = value / 100.0  # Normalize to range [0, 1]
 
     def apply_mixing(self):
-        """Mix the FT components based on slider values and display the result."""
-        if not any(img is not None and img.size > 0 for img in globals.ft_images):
-            print("No valid Fourier Transforms available for mixing.")
+        """Queue a mix of the current mixer settings on the background mixing worker."""
+        job = self.mixing_job()
+        if job is None or self.show_swept_region(job):
             return
 
-        # Check which output to use
-        selected_output = self.outputs_menu.currentText()
-        output_label = None
-        output_label = self.findChild(QLabel, selected_output)  # Find the label using object name
+        # Mix in the background; any mix still running for an older request is dropped
+        self.progress_bar.setValue(0)
+        self.awaited_generation = self.mixing_worker.submit(job)
 
+    def preview_mixing(self):
+        """Queue a cheap low-resolution mix while a slider is being dragged."""
+        slider = self.sender()
+        if slider is not None and not slider.isSliderDown():
+            return  # Keyboard and programmatic changes wait for a full mix
 
-        if output_label is None:
-            print(f"Invalid output label: {selected_output}")
-            return
-        
-        # mixed_ft = None  # Initialize the mixed FT
-        # region_size_percentage = self.region_size_slider.value()
-
-        # for i, weight in enumerate(ft_sliders):
-        #     if ft_components[i]["Magnitude"] is not None:
-        #         component = self.combos[i].currentText()
-        #         print(f"Selected component for viewer {i}: {component}")
-
-        #         # Reconstruct the complex FT based on the selected component type
-        #         if component in ["Magnitude", "Phase"]:
-        #             selected_magnitude = ft_components[i]["Magnitude"]
-        #             selected_phase = ft_components[i]["Phase"]
-        #             complex_ft = selected_magnitude * np.exp(1j * selected_phase)
-        #         elif component in ["Real", "Imaginary"]:
-        #             selected_real = ft_components[i]["Real"]
-        #             selected_imaginary = ft_components[i]["Imaginary"]
-        #             complex_ft = selected_real + 1j * selected_imaginary
-        #         else:
-        #             print(f"Unknown component: {component}")
-        #             continue
-
-        #         # Apply the region selection (whole, inner, or outer) based on combo box selection
-        #         region_selection = self.region_selector.currentText()
-        #         if region_selection == "Inner region":
-        #             # Only select low frequencies (inner region)
-        #             complex_ft = self.apply_region(complex_ft, region_size_percentage, region_type='inner')
-        #         elif region_selection == "Outer region":
-        #             # Only select high frequencies (outer region)
-        #             complex_ft = self.apply_region(complex_ft, region_size_percentage, region_type='outer')
-        #         # If "Whole FT", do nothing (default behavior)
-
-        #         # Apply weight and combine
-        #         weighted_ft = weight * complex_ft
-        #         if mixed_ft is None:
-        #             mixed_ft = weighted_ft
-        #         else:
-        #             mixed_ft += weighted_ft
-
-        mixed_ft = None  # Initialize the mixed FT
-        region_size_percentage = self.region_size_slider.value()
-
-        total_magnitude = np.zeros_like(globals.ft_components[0]["Magnitude"])
-        total_phase = np.zeros_like(globals.ft_components[0]["Phase"])        
-        magnitude_count = 0
-        phase_count = 0
-
-        for i, weight in enumerate(globals.ft_sliders):
-            if globals.ft_components[i]["Magnitude"] is not None:
-                component = self.combos[i].currentText()
-                print(f"Selected component for viewer {i}: {component}")
-
-                # Initialize complex_ft for this image
-                complex_ft = np.zeros_like(globals.ft_components[i]["Magnitude"], dtype=complex)
-
-                if component in ["Magnitude", "Phase"]:
-                    if component == "Magnitude":
-                                # Accumulate weighted magnitude
-                                selected_magnitude = globals.ft_components[i]["Magnitude"]
-                                total_magnitude += weight * selected_magnitude
-                                magnitude_count += 1
-
-                    elif component == "Phase":
-                                # Accumulate weighted phase
-                                selected_phase = globals.ft_components[i]["Phase"]
-                                total_phase += weight * selected_phase
-                                phase_count += 1
-
-                    # Compute the averages
-                    
-                    avg_magnitude = total_magnitude / max(magnitude_count, 1)  # Avoid division by 0
-                    avg_phase = total_phase / max(phase_count, 1)  # Avoid division by 0
-
-                    if magnitude_count==0:
-                        avg_magnitude=globals.ft_components[0]["Magnitude"]
-
-                    # Construct the final mixed FT
-                    mixed_ft = avg_magnitude * np.exp(1j * avg_phase)
-                    # Apply region selection (optional)
-                    region_selection = self.region_selector.currentText()
-                    if region_selection == "Inner region":
-                        mixed_ft = self.apply_region(mixed_ft, region_size_percentage, region_type="inner")
-                    elif region_selection == "Outer region":
-                        mixed_ft = self.apply_region(mixed_ft, region_size_percentage, region_type="outer")
-
-
-                elif component in ["Real", "Imaginary"]:
-                    if component == "Real":
-                        # Take the real component, apply the weight, and set imaginary part to 0
-                        selected_real = globals.ft_components[i]["Real"]
-                        complex_ft = weight * selected_real + 1j * 0
-
-                    elif component == "Imaginary":
-                        # Take the imaginary component, apply the weight, and set real part to 0
-                        selected_imaginary = globals.ft_components[i]["Imaginary"]
-                        complex_ft = 0 + 1j * (weight * selected_imaginary)
-
-                    else:
-                        print(f"Unknown component: {component}")
-                        continue
-                    
-                    # Enforce Hermitian symmetry to avoid mirroring artifacts
-                    # complex_ft = self.enforce_hermitian_symmetry(complex_ft)
-
-                    # Apply the region selection (whole, inner, or outer) based on combo box selection
-                    region_selection = self.region_selector.currentText()
-                    if region_selection == "Inner region":
-                        # Only select low frequencies (inner region)
-                        complex_ft = self.apply_region(complex_ft, region_size_percentage, region_type='inner')
-                    elif region_selection == "Outer region":
-                        # Only select high frequencies (outer region)
-                        complex_ft = self.apply_region(complex_ft, region_size_percentage, region_type='outer')
-                    # If "Whole FT", do nothing (default behavior)
-
-                    # Combine this image's contribution to the mixed FT
-                    if mixed_ft is None:
-                        mixed_ft = complex_ft
-                    else:
-                        mixed_ft += complex_ft
-
-
-
-        if mixed_ft is None:
-            print("No valid FT components were mixed.")
+        job = self.mixing_job()
+        if job is None:
             return
+        job["preview_shape"] = PREVIEW_SHAPE
+        self.awaited_generation = self.mixing_worker.submit(job)
 
-        # Apply inverse FFT to get the result
-        mixed_image = np.fft.ifft2(np.fft.ifftshift(mixed_ft)).real
-        mixed_image = np.clip(mixed_image, 0, 255).astype(np.uint8)  # Ensure valid range
-
-        # Convert to QPixmap and display in the output label
-        height, width = mixed_image.shape
-        q_image = QImage(mixed_image.data, width, height, width, QImage.Format_Grayscale8)
-        pixmap = QPixmap.fromImage(q_image)
-
-        if pixmap.isNull():
-            print("Failed to create QPixmap from mixed image.")
+    def scrub_region(self):
+        """Show the precomputed output for the region size being dragged, or a live preview."""
+        if not globals.spectra.loaded.any():
             return
+        job = self.mixing_job()
+        if job is None or self.show_swept_region(job):
+            return
+        self.preview_mixing()
+
+    def show_swept_region(self, job):
+        """Display the output for job from the background region sweep; returns False if it is not ready yet."""
+        if job["region_type"] is None:
+            return False
+        key = region_sweep.sweep_key(job)
+        bounds = region_sweep.bounds_key(job["spectra"][0].shape, job["region_size_percentage"], job["image_shape"])
+        mixed_image = self.mixing_worker.sweep_cache.get(key, job["region_type"], bounds)
+        if mixed_image is None:
+            return False
+
+        # Anything still queued or running for an older request is now stale
+        generation = self.mixing_worker.supersede()
+        self.progress_bar.setValue(100)
+        self.display_mixed_image(generation, mixed_image, job)
+        return True
+
+    def mixing_job(self):
+        """Collect the current mixer settings into a job for the mixing worker, or None."""
+        # Inputs still being resampled to a new common size are left out
+        stack = globals.spectra
+        loaded = stack.loaded_indices()
+        if stack.image_shape != (self.smallest_height, self.smallest_width):
+            loaded = loaded[:0]
+        if not len(loaded):
+            print("No valid Fourier Transforms available for mixing.")
+            return None
 
-        output_label.setPixmap(pixmap)
-        output_label.setFixedSize(width, height)
-        output_label.update()
-        print(f"Mixed image displayed in {selected_output}.")
+        # Check which output to use
+        selected_output = self.outputs_menu.currentText()
+        output_label = self.findChild(QLabel, selected_output)  # Find the label using object name
 
-        # self.progress_bar.setValue(100)  # Set progress bar to 100%
-        # print(f"Progress bar set to 100%. Mixed image displayed in {selected_output}.")
-        self.progress_bar.setValue(0)  # Reset to 0%
-        # Simulate progress
-        for value in range(0, 101, 20):  # Simulating progress in steps
+        if output_label is None:
+            print(f"Invalid output label: {selected_output}")
+            return None
+
+        job = {
+            "spectra": stack.rows(loaded),  # A view of the stack when the inputs are consecutive
+            "stamps": stack.stamps[loaded],
+            "weights": stack.weights[loaded],
+            "components": stack.components[loaded],
+            "mode": self.mode_selector.currentText(),
+            "region_type": self.selected_region_type(),
+            "region_size_percentage": self.region_size_slider.value(),
+            "image_shape": stack.image_shape if globals.half_spectrum else None,
+            "image_size": stack.image_shape,
+            "output": selected_output,
+        }
+        return job
+
+    def update_mixing_progress(self, generation, value):
+        """Show the progress of the latest mixing request."""
+        if self.mixing_worker.is_current(generation):
             self.progress_bar.setValue(value)
-            QCoreApplication.processEvents()  # Process events to update UI
-
-    def enforce_hermitian_symmetry(self, complex_ft):
-        """Enforce Hermitian symmetry on the Fourier Transform to avoid mirroring artifacts."""
-        height, width = complex_ft.shape
 
-        # Top-left quadrant remains unchanged
-        top_left = complex_ft[: height // 2 + 1, : width // 2 + 1]
-
-        # Reflect top-left to bottom-right
-        bottom_right = np.conj(np.flip(np.flip(top_left, axis=0), axis=1))
-
-        # Create a new array for symmetric FT
-        symmetric_ft = np.zeros_like(complex_ft, dtype=complex)
+    def display_mixed_image(self, generation, mixed_image, job):
+        """Display a finished mix, unless a newer request has been made since."""
+        if not self.mixing_worker.is_current(generation):
+            return
+        self.awaited_generation = None
 
-        # Top-left quadrant
-        symmetric_ft[: height // 2 + 1, : width // 2 + 1] = top_left
+        if mixed_image is None:
+            print("No valid FT components were mixed.")
+            self.progress_bar.setValue(0)
+            return
 
-        # Bottom-right quadrant (ensure correct indexing for odd sizes)
-        symmetric_ft[height // 2 + 1 :, width // 2 + 1 :] = bottom_right[
-            : height - (height // 2 + 1), : width - (width // 2 + 1)
-        ]
+        if self.show_output(job["output"], mixed_image, job["image_size"]):
+            instrumentation.log("Mixed image displayed in %s.", job["output"])
 
-        # Handle vertical symmetry for the middle column (if width is odd)
-        if width % 2 == 1:
-            symmetric_ft[height // 2 + 1 :, width // 2] = np.conj(
-                np.flip(top_left[:, width // 2], axis=0)
-            )[: height - (height // 2 + 1)]
+    def show_output(self, output, mixed_image, image_size):
+        """Display a uint8 image in the output label called output, stretched to image_size (height, width)."""
+        output_label = self.findChild(QLabel, output)
+        if output_label is None:
+            print(f"Invalid output label: {output}")
+            return False
 
-        # Handle horizontal symmetry for the middle row (if height is odd)
-        if height % 2 == 1:
-            symmetric_ft[height // 2, width // 2 + 1 :] = np.conj(
-                np.flip(top_left[height // 2, :], axis=0)
-            )[: width - (width // 2 + 1)]
+        with instrumentation.span("pixmap_upload"):
+            # Convert to QPixmap and display in the output label
+            pixmap = QPixmap.fromImage(array_to_qimage(mixed_image))
 
-        return symmetric_ft
+            # Previews are smaller than the image; stretch them over the output
+            height, width = image_size
+            if pixmap.width() != width or pixmap.height() != height:
+                pixmap = pixmap.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
 
+            if pixmap.isNull():
+                print("Failed to create QPixmap from mixed image.")
+                return False
 
+            output_label.setPixmap(pixmap)
+        output_label.setFixedSize(width, height)
+        output_label.update()
+        return True
+
+    def toggle_stream(self, play):
+        """Start or stop mixing the inputs' frame sequences."""
+        if play:
+            if not self.start_stream():
+                self.play_button.blockSignals(True)
+                self.play_button.setChecked(False)
+                self.play_button.blockSignals(False)
+        else:
+            self.stream_player.stop()
+            self.progress_bar.setValue(0)
+
+    def start_stream(self):
+        """Mix the loaded inputs frame by frame with the current settings; returns False if there is nothing to play."""
+        job = self.mixing_job()
+        if job is None:
+            return False
+        loaded = globals.spectra.loaded_indices()
+        if any(self.image_paths[i] is None for i in loaded):
+            print("Frame sequences can only be played from images loaded from files.")
+            return False
+        try:
+            sequences = [frame_stream.FrameSequence(self.image_paths[i]) for i in loaded]
+        except (OSError, ValueError) as e:
+            print(f"Cannot read the frame sequences: {e}")
+            return False
+        if all(len(sequence) == 1 for sequence in sequences):
+            print("No frame sequence loaded: upload an animated GIF, an image stack or a frame directory.")
+            return False
+
+        recipe = {
+            "mode": job["mode"],
+            "region": {"type": job["region_type"], "size": job["region_size_percentage"]},
+            "inputs": [{"component": component, "weight": float(weight)}
+                       for component, weight in zip(job["components"], job["weights"])],
+            "half_spectrum": globals.half_spectrum,
+            "single_precision": globals.single_precision,
+        }
+        # Results of the interactive mixer would overwrite the frames
+        self.mixing_worker.supersede()
+        self.stream_output = (job["output"], job["image_size"])
+        stream = self.stream_player.play(sequences, recipe, self.fps_box.value())
+        print(f"Playing {stream.length} frames at {self.fps_box.value()} fps in {job['output']}.")
+        return True
+
+    def display_stream_frame(self, index, mixed_image):
+        """Display a frame of the sequence being played."""
+        output, image_size = self.stream_output
+        self.show_output(output, mixed_image, image_size)
+        stream = self.stream_player.stream
+        if stream is not None:
+            self.progress_bar.setValue(int(100 * (index + 1) / stream.length))
+
+    def stream_finished(self, stream):
+        """Report a finished playback and release the play button."""
+        if stream.error is None:
+            print(f"Played {stream.frames_mixed} of {stream.length} frames ({stream.frames_dropped} dropped).")
+        self.play_button.blockSignals(True)
+        self.play_button.setChecked(False)
+        self.play_button.blockSignals(False)
+
+    def selected_region_type(self):
+        """Map the region combo box to the mixing engine's region type."""
+        region_selection = self.region_selector.currentText()
+        if region_selection == "Inner region":
+            return "inner"
+        elif region_selection == "Outer region":
+            return "outer"
+        return None  # "Whole FT"
 
     def apply_region(self, complex_ft, region_size_percentage, region_type):
         """Apply the region selection (inner or outer) to the FT component."""
-        # Get the size of the FT component
-        width, height = complex_ft.shape
-
-        # Calculate region size as a percentage of the total dimensions
-        region_size_x = int((region_size_percentage / 100) * width / 2)  # Half-size for inner region
-        region_size_y = int((region_size_percentage / 100) * height / 2)
-
-        # Center of the Fourier Transform
-        center_x, center_y = width // 2, height // 2
-
-        if region_type == 'inner':
-            # Keep only the low frequencies (center region), set everything else to 0
-            mask = np.zeros_like(complex_ft, dtype=bool)
-            mask[
-                center_x - region_size_x : center_x + region_size_x,
-                center_y - region_size_y : center_y + region_size_y,
-            ] = True
-            complex_ft[~mask] = 0  # Zero out everything outside the mask
-
-        elif region_type == 'outer':
-            # Keep only the high frequencies (outer region), set the center region to 0
-            mask = np.ones_like(complex_ft, dtype=bool)
-            mask[
-                center_x - region_size_x : center_x + region_size_x,
-                center_y - region_size_y : center_y + region_size_y,
-            ] = False
-            complex_ft[~mask] = 0  # Zero out the center region
-
-        return complex_ft
+        return mixer.apply_region(complex_ft, region_size_percentage, region_type)
 
     # def apply_region(self, complex_ft, region_size_percentage, region_type):
     #     """Apply the region selection to the FT component."""
@@ -669,12 +859,10 @@ class ImageEqualizer(QMainWindow):
         """Update the region selection based on the combo box and slider values."""
         selected_region = self.region_selector.currentText()  # Get the selected region
         region_size_percentage = self.region_size_slider.value()  # Get the percentage size of the rectangle
-        print(f"Region Size: {region_size_percentage}%")
-        print(f"item selected:{selected_region}")
+        instrumentation.log("Region Size: %d%%, item selected: %s", region_size_percentage, selected_region)
 
         if selected_region == "Whole FT":
             self.clear_regions()  # Clear any selected regions (reset to default mode)
-            print("No region selected, applying mixing to the whole FT.")
         elif selected_region == "Inner region":
             # Draw the inner region (low-frequency part of the FT)
             self.draw_regions('inner', region_size_percentage)
@@ -686,6 +874,7 @@ class ImageEqualizer(QMainWindow):
         """Clear any drawn rectangles to reset to the default mode."""
         for ft_label in globals.ft_labels:
             ft_label.rectangles = []  # Clear the stored rectangles for each FT label
+            ft_label.region = None
             ft_label.update()  # Redraw the FT label without the rectangles
 
     def draw_regions(self, region_type, region_size_percentage):
@@ -693,24 +882,136 @@ class ImageEqualizer(QMainWindow):
         for ft_label in globals.ft_labels:
             ft_label.set_region(region_type, region_size_percentage)  # Set region for each FT label
 
+    def export_timings(self):
+        """Save the recorded timing spans as a Chrome trace or as a JSON summary."""
+        chrome_filter = "Chrome trace (*.json)"
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Export Timings", "timings.json", f"{chrome_filter};;Timing summary (*.json)"
+        )
+        if not file_path:
+            return
+        if selected_filter == chrome_filter:
+            instrumentation.export_chrome_trace(file_path)
+        else:
+            instrumentation.export_json(file_path)
+        print(f"Timings exported to {file_path}")
+
+    def save_session(self):
+        """Remember the loaded images and mixer settings in the spectrum cache."""
+        if self.spectrum_cache is None:
+            return
+        inputs = []
+        for i, path in enumerate(self.image_paths):
+            if path is None or self.image_hashes[i] is None:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            inputs.append({
+                "index": i,
+                "path": path,
+                "hash": self.image_hashes[i],
+                "file": [stat.st_size, stat.st_mtime],
+                "component": self.combos[i].currentText(),
+                "weight": self.component_sliders[i].value(),
+            })
+        if not inputs:
+            return
+        self.spectrum_cache.save_session({
+            "inputs": inputs,
+            "half_spectrum": globals.half_spectrum,
+            "single_precision": globals.single_precision,
+            "mode": self.mode_selector.currentText(),
+            "region": self.region_selector.currentText(),
+            "region_size": self.region_size_slider.value(),
+            "output": self.outputs_menu.currentText(),
+        })
+
+    def restore_session(self):
+        """Reload the images and mixer settings of the last session, reusing their cached spectra."""
+        session = self.spectrum_cache.load_session() if self.spectrum_cache is not None else None
+        if not session:
+            self.statusBar().showMessage("No previous session to restore.", 5000)
+            return
+
+        for box, enabled in ((self.half_spectrum_box, session["half_spectrum"]),
+                             (self.single_precision_box, session["single_precision"])):
+            box.blockSignals(True)
+            box.setChecked(enabled)
+            box.blockSignals(False)
+        globals.half_spectrum = session["half_spectrum"]
+        globals.single_precision = session["single_precision"]
+        self.mode_selector.setCurrentText(session["mode"])
+        self.region_selector.setCurrentText(session["region"])
+        self.region_size_slider.setValue(session["region_size"])
+        self.outputs_menu.setCurrentText(session["output"])
+
+        if not hasattr(self, 'uploaded_images'):
+            self.uploaded_images = [None] * globals.input_count
+        for entry in session["inputs"]:
+            i = entry["index"]
+            if i >= globals.input_count:
+                continue
+            try:
+                stat = os.stat(entry["path"])
+                # Opening only reads the header; the pixels are decoded if the spectrum is not cached
+                image = frame_stream.open_frame(entry["path"])
+            except (OSError, ValueError) as e:
+                print(f"Cannot restore image {i + 1}: {e}")
+                continue
+            image_key = entry["hash"]
+            if [stat.st_size, stat.st_mtime] != entry["file"]:
+                image = image.convert("L")  # Changed on disk since the session was saved
+                image_key = image_hash(image)
+            self.uploaded_images[i] = image
+            self.image_hashes[i] = image_key
+            self.image_paths[i] = entry["path"]
+            self.combos[i].setCurrentText(entry["component"])
+            self.component_sliders[i].setValue(entry["weight"])
+
+        self.update_smallest_dimensions()
+        self.recompute_spectra()
+
+    def closeEvent(self, event):
+        """Remember the session, then stop the mixing thread and the ingestion pool."""
+        self.save_session()
+        self.stream_player.stop()
+        self.mixing_worker.stop()
+        self.ingestion_pool.shutdown()
+        super().closeEvent(event)
+
     def reset(self):
         """Reset the mixer controls, clearing all images and data."""
-        # global ft_labels, ft_images, ft_components, ft_sliders
+        # global ft_labels, spectra, ft_components
+
+        self.stream_player.stop()
 
         # Reinitialize global variables
         globals.ft_labels = []
-        globals.ft_images = [None] * 4
+        globals.spectra.clear()
         self.image_labels=[]  # Store all image labels for resizing
-        globals.ft_sliders = [0,0,0,0]
         self.combos=[]
-        globals.ft_components = [{"Magnitude": None, "Phase": None, "Real": None, "Imaginary": None} for _ in range(4)]
+        self.component_sliders=[]
+        globals.ft_components.clear()
+        globals.half_spectrum = False
+        globals.single_precision = False
 
         # Reset dimensions
         self.smallest_width = None
         self.smallest_height = None
 
         # Reset uploaded images list
-        self.uploaded_images = [None] * 4
+        self.uploaded_images = [None] * globals.input_count
+        self.image_hashes = [None] * globals.input_count
+        self.image_paths = [None] * globals.input_count
+        self.ingested_keys = [None] * globals.input_count
+        self.pending_keys = [None] * globals.input_count
+        self.remix_after_ingest = False
+        self.awaited_generation = None
+        self.ingest_cache.clear()
+        self.mixing_worker.sweep_cache.clear()
+        self.workspace.release()
         # Clear and reset image labels
         for label in self.image_labels:
             label.clear()  # Clear the QLabel content
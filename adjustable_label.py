@@ -1,9 +1,53 @@
 from PyQt5.QtWidgets import QLabel
-from PyQt5.QtCore import Qt,QRect,QThread, pyqtSignal, QObject,QCoreApplication
+from PyQt5.QtCore import Qt,QRect,QThread, QTimer, pyqtSignal, QObject,QCoreApplication
 from PyQt5.QtGui import QPixmap,QImage,QColor, QPen,QPainter
-from PIL import ImageEnhance
+from PyQt5 import sip
+from PIL import Image
 import numpy as np
 import globals
+import instrumentation
+import mixer
+import spectrum_view
+
+
+def shared_grayscale(image):
+    """Return a (uint8 array, Pillow image) pair that share one pixel buffer.
+
+    Pillow cannot expose its own storage to NumPy, so the pixels are copied
+    out once; the returned Pillow image is then a view of that array.
+    """
+    array = np.array(image.convert("L"), dtype=np.uint8)
+    height, width = array.shape
+    return array, Image.frombuffer("L", (width, height), array, "raw", "L", 0, 1)
+
+
+def array_to_qimage(array):
+    """Wrap a 2-D uint8 array in a grayscale QImage without copying.
+
+    Rows may be padded: the array's row stride is passed as bytes per line.
+    The QImage keeps a reference to the array so the buffer outlives it.
+    """
+    if array.strides[1] != 1 or array.strides[0] < 0:
+        array = np.ascontiguousarray(array)
+    height, width = array.shape
+    pixels = sip.voidptr(array.__array_interface__["data"][0])
+    qimage = QImage(pixels, width, height, array.strides[0], QImage.Format_Grayscale8)
+    qimage.ndarray = array
+    return qimage
+
+
+def brightness_contrast_lut(histogram, brightness, contrast):
+    """Return a 256-entry uint8 lookup table for a brightness then contrast adjustment.
+
+    Matches ImageEnhance.Brightness(...).enhance(brightness) followed by
+    ImageEnhance.Contrast(...).enhance(contrast) exactly; the mean gray level
+    the contrast pivots on is taken from the full-resolution histogram.
+    """
+    levels = np.arange(256, dtype=np.float32)
+    brightened = np.clip(levels * np.float32(brightness), 0, 255).astype(np.uint8)
+    mean = np.float32(int(np.dot(histogram, brightened) / histogram.sum() + 0.5))
+    contrasted = mean + np.float32(contrast) * (brightened.astype(np.float32) - mean)
+    return np.clip(contrasted, 0, 255).astype(np.uint8)
 
 
 class AdjustableLabel(QLabel):
@@ -13,9 +57,22 @@ class AdjustableLabel(QLabel):
         self.contrast = 1.0    # Default contrast
         self.last_mouse_position = None
         self.original_image = None  # Store original image for adjustments
+        self.image_array = None     # uint8 pixels shared with original_image
+        self.workspace = None       # Scratch buffers for display, shared with the window
+        self.histogram = None       # Gray-level histogram of the original image
+        self.display_pixels = None  # original image at the label's size, for adjustments
+
+        # Mouse moves only update the adjustment; the repaint happens at most once per frame
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.setInterval(16)
+        self.repaint_timer.timeout.connect(self.update_image)
         self.ft_image = None        # Store the Fourier Transform of the image
         self.selected_component = "Magnitude"  # Default component to display
         self.rectangles = []  # Store rectangles for region selection
+        self.region = None  # (region_type, size percentage) drawn as a rectangle
+        self.ft_view = None  # (component, index) shown when this is an FT viewer
+        self.zoom = 1.0  # FT viewer zoom around DC
 
     def paintEvent(self, event):
         """Override the paintEvent to draw rectangles on the QLabel."""
@@ -32,10 +89,12 @@ class AdjustableLabel(QLabel):
 
     def set_region(self, region_type, region_size_percentage):
         """Set the rectangle region (inner or outer) for mixing."""
+        self.region = (region_type, region_size_percentage)
         width, height = self.width(), self.height()
 
-        region_size_x = int((region_size_percentage / 100) * width)
-        region_size_y = int((region_size_percentage / 100) * height)
+        # A zoomed viewer shows 1/zoom of the spectrum, so the region appears larger
+        region_size_x = int(min(1.0, region_size_percentage * self.zoom / 100) * width)
+        region_size_y = int(min(1.0, region_size_percentage * self.zoom / 100) * height)
 
         # Calculate the top-left corner position to center the rectangle
         x_offset = (width - region_size_x) // 2
@@ -50,36 +109,52 @@ class AdjustableLabel(QLabel):
         self.rectangles = [rect]
         self.update()  # Redraw the label (this calls paintEvent)
 
-    def set_image(self, image,index):
-        """Set the original image (Pillow Image object) and reset adjustments."""
-        self.original_image = image
+    def set_image(self, image,index, ft_image=None, components=None):
+        """Set the original image (Pillow Image object) and reset adjustments.
+
+        Pass ft_image to reuse an already computed spectrum of this image, and
+        components to seed its already derived FT components.
+        """
+        self.image_array, self.original_image = shared_grayscale(image)
+        self.histogram = np.bincount(self.image_array.ravel(), minlength=256)
+        self.display_pixels = None
         self.update_image()
-        # if ft_images[index] is None:
-        self.calculate_ft(index)
+        if ft_image is None:
+            self.calculate_ft(index)
+        else:
+            self.set_ft(index, ft_image, components)
         self.plot_ft_component("Magnitude",index)  # Plot default component after setting 
 
     def update_image(self):
         """Apply brightness and contrast adjustments and display the updated image."""
         if self.original_image:
-            # Apply brightness and contrast adjustments
-            enhanced_image = ImageEnhance.Brightness(self.original_image).enhance(self.brightness)
-            enhanced_image = ImageEnhance.Contrast(enhanced_image).enhance(self.contrast)
-
-            qimage = self.pillow_to_qimage(enhanced_image)
-            pixmap = QPixmap.fromImage(qimage)
-
-            # Resize the pixmap to the QLabel's fixed size
-            resized_pixmap = pixmap.scaled(
-                self.width(), self.height(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation
-            )
-            self.setPixmap(resized_pixmap)
+            pixels = self.display_resolution_pixels()
+            if self.brightness != 1.0 or self.contrast != 1.0:
+                # Apply brightness and contrast adjustments as a single lookup
+                lut = brightness_contrast_lut(self.histogram, self.brightness, self.contrast)
+                if self.workspace is None:
+                    pixels = lut[pixels]
+                else:
+                    # The pixmap is a copy, so the buffer is free again once it is made
+                    pixels = np.take(lut, pixels, mode="clip",
+                                     out=self.workspace.buffer("display.adjusted", pixels.shape, np.uint8))
+            with instrumentation.span("pixmap_upload"):
+                self.setPixmap(QPixmap.fromImage(array_to_qimage(pixels)))
+
+    def display_resolution_pixels(self):
+        """Return the original image at the QLabel's size, cached until the image or size changes."""
+        width, height = self.width(), self.height()
+        if self.display_pixels is None or self.display_pixels.shape != (height, width):
+            if self.image_array.shape == (height, width):
+                self.display_pixels = self.image_array
+            else:
+                resized = self.original_image.resize((width, height), Image.Resampling.BILINEAR)
+                self.display_pixels = np.asarray(resized)
+        return self.display_pixels
 
     def pillow_to_qimage(self, image):
-        """Convert a Pillow image to QImage."""
-        data = np.array(image)
-        height, width = data.shape if len(data.shape) == 2 else data.shape[:2]
-        bytes_per_line = width
-        return QImage(data.data, width, height, bytes_per_line, QImage.Format_Grayscale8)
+        """Convert a grayscale Pillow image to QImage."""
+        return array_to_qimage(np.asarray(image.convert("L")))
 
     def mousePressEvent(self, event):
         """Capture the initial mouse position on press."""
@@ -100,66 +175,73 @@ class AdjustableLabel(QLabel):
             self.contrast += delta.x() * 0.01
             self.contrast = max(0.1, min(3.0, self.contrast))  # Clamp values
 
-            # Update the displayed image
-            self.update_image()
+            # Coalesce pending moves into one repaint per frame
+            if not self.repaint_timer.isActive():
+                self.repaint_timer.start()
 
     def calculate_ft(self,i):
         """Calculate the Fourier Transform of the current image."""
         if self.original_image:
-            np_image = np.array(self.original_image)
-            self.ft_image = np.fft.fftshift(np.fft.fft2(np_image))
-            globals.ft_images[i]=self.ft_image
-            print(f"the index is {i}")
-            print(f"FT image calculated: {self.ft_image.shape}")
+            np_image = self.image_array
+            self.set_ft(i, mixer.forward(np_image, globals.half_spectrum, globals.single_precision))
+            instrumentation.log("FT image %d calculated: %s", i, self.ft_image.shape)
+
+    def set_ft(self, i, ft_image, components=None):
+        """Register the Fourier Transform of the current image for input i."""
+        self.ft_image = globals.spectra.set(i, ft_image, self.image_array.shape)
+        if components:
+            components = {name: globals.spill.adopt(value) for name, value in components.items()}
+        globals.ft_components.set_spectrum(i, self.ft_image, components)
 
     def plot_ft_component(self, component,index):
-        """Plot the selected Fourier Transform component."""
-        if globals.ft_images[index] is None:
+        """Plot the selected Fourier Transform component at the viewer's resolution."""
+        if globals.spectra.get(index) is None:
             print("FT image is not available.")
             return
-    
-        # Calculate and store FT components
-        globals.ft_components[index]["Magnitude"] = np.abs(globals.ft_images[index])
-        globals.ft_components[index]["Phase"] = np.angle(globals.ft_images[index])
-        globals.ft_components[index]["Real"] = np.real(globals.ft_images[index])
-        globals.ft_components[index]["Imaginary"] = np.imag(globals.ft_images[index])
-      
-        ft_component = globals.ft_components[index][component]
-
-        if ft_component is None:
-            print(f"Failed to extract {component} component.")
-            return
 
-        # Debugging: Print component details
-        print(f"{component} component calculated. Shape: {ft_component.shape}, Min: {ft_component.min()}, Max: {ft_component.max()}")
-        print(f"the index is {index}")
-        print(f"the ft-components are {ft_component[3][0]}")
+        ft_label =globals.ft_labels[index]  # Get the target QLabel
+        ft_label.setFixedSize(300, 200)  # Components are rendered at the viewer's size
+        ft_label.ft_view = (component, index)
 
-        # Apply log scale for better visibility (except for Phase, as it doesn't need scaling)
-        if component != "Phase":
-            ft_component = np.log1p(np.abs(ft_component))  # Add 1 to avoid log(0)
+        # Only the requested component is derived (and memoized) by the store,
+        # and it is reduced to the viewer's resolution before tone-mapping
+        image_width = globals.spectra.image_shape[1] if globals.half_spectrum else None
+        ft_component = spectrum_view.render_component(
+            globals.ft_components, index, component,
+            (ft_label.width(), ft_label.height()), ft_label.zoom, image_width, self.workspace,
+        )
 
-        # Normalize the component to range 0-255
-        ft_component_min = np.min(ft_component)
-        ft_component_max = np.max(ft_component)
-        if ft_component_max == ft_component_min:  # Avoid division by zero
+        if ft_component is None:
             print(f"{component} component has no variation (min=max). Cannot normalize.")
             return
 
-        # Normalize to 0-255 for display
-        ft_component = 255 * (ft_component - ft_component_min) / (ft_component_max - ft_component_min)
-        ft_component = ft_component.astype(np.uint8)
+        instrumentation.log("%s component %d rendered. Shape: %s, zoom: %.2f, store footprint: %.1f MB",
+                            component, index, ft_component.shape, ft_label.zoom,
+                            globals.ft_components.nbytes / 2**20)
 
         # Convert to QPixmap for display
         try:
-            height, width = ft_component.shape
-            q_image = QImage(ft_component.data,width, height, QImage.Format_Grayscale8)
-            pixmap = QPixmap.fromImage(q_image)
-            # Display the FT component on the corresponding label
-            ft_label =globals.ft_labels[index]  # Get the target QLabel
-            ft_label.setPixmap(pixmap)
-            ft_label.setFixedSize(300, 200)  # Resize QLabel to match the image
+            with instrumentation.span("pixmap_upload"):
+                pixmap = QPixmap.fromImage(array_to_qimage(ft_component)).scaled(
+                    ft_label.width(), ft_label.height(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+                )
+                # Display the FT component on the corresponding label
+                ft_label.setPixmap(pixmap)
             ft_label.update()  # Force the label to refresh
-            print(f"{component} component successfully displayed on label {index}.")
         except Exception as e:
             print(f"Error displaying {component} component: {e}")
+
+    def wheelEvent(self, event):
+        """Zoom into the displayed FT component around DC."""
+        if self.ft_view is None:
+            super().wheelEvent(event)
+            return
+
+        steps = event.angleDelta().y() / 120
+        self.zoom = max(1.0, min(spectrum_view.MAX_ZOOM, self.zoom * 1.25 ** steps))
+        component, index = self.ft_view
+        self.plot_ft_component(component, index)
+
+        # Keep the region overlay in spectrum coordinates
+        if self.region is not None:
+            self.set_region(*self.region)
@@ -0,0 +1,199 @@
+"""Mix many image sets from the command line, without a display.
+
+Usage:
+    python batch_mix.py RECIPE (--sets DIR | --manifest FILE) --output DIR [--workers N]
+
+The recipe (JSON, or YAML if PyYAML is installed) describes one mix:
+
+    {
+        "mode": "Mag/Phase",
+        "region": {"type": "inner", "size": 30},
+        "inputs": [
+            {"component": "Magnitude", "weight": 1.0},
+            {"component": "Phase", "weight": 0.8}
+        ],
+        "half_spectrum": false,
+        "single_precision": false
+    }
+
+"region" may be omitted or set to "whole", and "inner" or "outer" stand for
+that region at size 50. With --sets, every subdirectory of
+DIR is one image set and its images, sorted by name, are the inputs in recipe
+order. With --manifest, every line of FILE is a JSON object such as
+{"name": "scan-042", "inputs": ["a.png", "b.png"]}. Each mix is written to
+DIR/<name>.png. The images of a set are resized to their smallest common size
+and mixed with the same engine as the desktop application.
+"""
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+import fft_backend
+import mixer
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.bmp", "*.gif")
+
+
+def load_recipe(path):
+    """Read and validate a recipe file, returning it as a dict."""
+    with open(path) as recipe_file:
+        if path.endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("YAML recipes need PyYAML (pip install pyyaml); use JSON instead.")
+            recipe = yaml.safe_load(recipe_file)
+        else:
+            recipe = json.load(recipe_file)
+
+    if recipe.get("mode") not in (mixer.MAG_PHASE, mixer.REAL_IMAG):
+        raise SystemExit(f"Recipe mode must be {mixer.MAG_PHASE!r} or {mixer.REAL_IMAG!r}.")
+    if not recipe.get("inputs"):
+        raise SystemExit("Recipe needs at least one input.")
+    for i, spec in enumerate(recipe["inputs"]):
+        if spec.get("component") not in mixer.COMPONENTS:
+            raise SystemExit(f"Input {i + 1}: component must be one of {mixer.COMPONENTS}.")
+        spec.setdefault("weight", 1.0)
+
+    region = recipe.get("region") or "whole"
+    if isinstance(region, str):
+        # "whole", "inner" and "outer" are shorthands for that region at the default size
+        region = {"type": region}
+    if not isinstance(region, dict) or region.get("type") not in (None, "whole", "inner", "outer"):
+        raise SystemExit("Recipe region type must be 'whole', 'inner' or 'outer'.")
+    if region.get("type") in (None, "whole"):
+        region["type"] = None
+    region.setdefault("size", 50)
+    recipe["region"] = region
+    return recipe
+
+
+def image_sets_from_directory(directory):
+    """Yield (name, paths) for every subdirectory of directory."""
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if entry.is_dir():
+            paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(entry.path, pattern)))
+            yield entry.name, paths
+
+
+def image_sets_from_manifest(manifest):
+    """Yield (name, paths) for every line of a JSON-lines manifest."""
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest) as manifest_file:
+        for line_number, line in enumerate(manifest_file, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            paths = [os.path.join(base, path) for path in entry["inputs"]]
+            yield entry.get("name", f"set_{line_number:06d}"), paths
+
+
+def mix_set(name, paths, recipe, output_dir):
+    """Mix one image set according to recipe and write it; returns (name, seconds, error)."""
+    start = time.perf_counter()
+    try:
+        if len(paths) != len(recipe["inputs"]):
+            raise ValueError(f"expected {len(recipe['inputs'])} images, found {len(paths)}")
+
+        # Same ingestion as the desktop application: grayscale, resized to the smallest size
+        images = [Image.open(path).convert("L") for path in paths]
+        target_size = (min(image.size[0] for image in images), min(image.size[1] for image in images))
+        arrays = [np.asarray(image.resize(target_size, Image.Resampling.LANCZOS)) for image in images]
+
+        half_spectrum = recipe.get("half_spectrum", False)
+        spectra = np.stack([
+            mixer.forward(array, half_spectrum, recipe.get("single_precision", False)) for array in arrays
+        ])
+        mixed_image = mixer.mix(
+            spectra,
+            [spec["weight"] for spec in recipe["inputs"]],
+            [spec["component"] for spec in recipe["inputs"]],
+            recipe["mode"],
+            recipe["region"]["type"],
+            recipe["region"]["size"],
+            arrays[0].shape if half_spectrum else None,
+        )
+        if mixed_image is None:
+            raise ValueError("no input contributes to the mix")
+
+        Image.fromarray(mixed_image).save(os.path.join(output_dir, f"{name}.png"))
+        return name, time.perf_counter() - start, None
+    except Exception as e:
+        return name, time.perf_counter() - start, str(e)
+
+
+def _init_worker():
+    # One FFT thread per process; the pool already uses every core
+    fft_backend.set_backend(os.environ.get(fft_backend.BACKEND_ENV, "auto"),
+                            os.environ.get(fft_backend.WORKERS_ENV, 1))
+
+
+def run(image_sets, recipe, output_dir, workers=None):
+    """Mix every (name, paths) set on a process pool.
+
+    Returns (mixed count, [(name, error)], wall-clock seconds, summed per-set seconds).
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 4 * workers  # Stream the sets instead of queueing them all up front
+    mixed, failures, busy = 0, [], 0.0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        in_flight = set()
+        image_sets = iter(image_sets)
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < max_in_flight:
+                image_set = next(image_sets, None)
+                if image_set is None:
+                    exhausted = True
+                else:
+                    in_flight.add(executor.submit(mix_set, *image_set, recipe, output_dir))
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, seconds, error = future.result()
+                busy += seconds
+                if error is None:
+                    mixed += 1
+                else:
+                    failures.append((name, error))
+                    print(f"{name}: {error}", file=sys.stderr)
+
+    return mixed, failures, time.perf_counter() - start, busy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recipe", help="JSON or YAML recipe file")
+    sources = parser.add_mutually_exclusive_group(required=True)
+    sources.add_argument("--sets", help="directory with one subdirectory per image set")
+    sources.add_argument("--manifest", help="JSON-lines manifest with one image set per line")
+    parser.add_argument("--output", required=True, help="directory for the mixed images")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    recipe = load_recipe(args.recipe)
+    os.makedirs(args.output, exist_ok=True)
+    image_sets = image_sets_from_directory(args.sets) if args.sets else image_sets_from_manifest(args.manifest)
+
+    mixed, failures, seconds, busy = run(image_sets, recipe, args.output, args.workers)
+
+    total = mixed + len(failures)
+    print(f"Mixed {mixed} of {total} image sets in {seconds:.1f}s "
+          f"({mixed / seconds if seconds else 0:.1f} sets/s, "
+          f"{1000 * busy / total if total else 0:.0f} ms per set per worker, {len(failures)} failed).")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""Time the FFT, component, region and mixing hot paths of the application.
+
+Usage:
+    python benchmark.py [--sizes WxH,...] [--repeat N] [--save FILE] [--compare FILE] [--threshold F]
+
+Runs headless on Qt's offscreen platform. A synthetic image of every size is
+loaded into every input of a real ImageEqualizer window (four, or
+IMAGE_EQUALIZER_INPUTS), then each case is run --repeat times and its fastest
+time is kept:
+
+    calculate_ft            AdjustableLabel.calculate_ft
+    plot_ft_component[C]    AdjustableLabel.plot_ft_component of a freshly set spectrum
+    apply_region[R]         ImageEqualizer.apply_region on a copy of a spectrum
+    apply_mixing[M,R]       ImageEqualizer.apply_mixing until the mix is displayed, with the worker's
+                            mixers reset before every run, i.e. the full mixing kernel and inverse FFT
+    apply_mixing_cached[M,R]
+                            the same, repeating one mix with the worker's caches kept (for Mag/Phase,
+                            the cached magnitude and phasor; for Real/Imaginary, once the basis images
+                            are built, i.e. the FFT-free weighted sum)
+    scrub_region[M,R]       ImageEqualizer.scrub_region once the region sweep is done
+    ingest                  ImageEqualizer.ingest (resample + FFT on the pool) of every input
+
+--save writes the results to a JSON baseline. --compare reads a baseline and
+exits with status 1 if any case is more than --threshold (default 0.25, i.e.
+25%) slower than in the baseline; differences below --min-delta-ms are treated
+as noise. The default sizes include non-power-of-two and prime dimensions.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PIL import Image
+from PyQt5.QtWidgets import QApplication
+
+import fft_backend
+import globals
+import mixer
+from Image_equalizer import ImageEqualizer
+
+DEFAULT_SIZES = "256x256,512x512,640x480,1000x750,509x383,1021x1021"
+
+MODES = {  # Components alternate over the inputs
+    mixer.MAG_PHASE: ["Magnitude", "Phase"],
+    mixer.REAL_IMAG: ["Real", "Imaginary"],
+}
+REGIONS = ["Whole FT", "Inner region", "Outer region"]
+REGION_SIZE = 30
+
+
+def parse_sizes(text):
+    """Parse "WxH,WxH" into a list of (width, height)."""
+    sizes = []
+    for item in text.split(","):
+        width, height = item.lower().split("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def synthetic_image(width, height, seed=0):
+    """A grayscale test image with smooth structure plus noise, so every band of the spectrum is populated."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    pattern = 96 + 64 * np.sin(x / (7 + seed)) * np.cos(y / (11 + seed)) + rng.normal(0, 24, (height, width))
+    return Image.fromarray(np.clip(pattern, 0, 255).astype(np.uint8))
+
+
+def best_time(function, repeat, setup=None):
+    """Run setup() then function() repeat times (after one warm-up) and return the fastest function() time."""
+    best = float("inf")
+    for run in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if run > 0:
+            best = min(best, elapsed)
+    return best
+
+
+class Bench:
+    """Drives an offscreen ImageEqualizer window through the benchmark cases."""
+
+    def __init__(self, app, repeat):
+        self.app = app
+        self.repeat = repeat
+        self.window = ImageEqualizer()
+        self.window.spectrum_cache = None  # Time the computation, not earlier runs' cached spectra
+        self.displayed = None
+        # Connected after the window's own slot, so it fires once the mix is on screen
+        self.window.mixing_worker.result_ready.connect(self._mix_displayed)
+
+    def _mix_displayed(self, generation, mixed_image, job):
+        self.displayed = generation
+
+    def wait_for_ingestion(self):
+        while any(self.window.pending_keys):
+            self.app.processEvents()
+        self.app.processEvents()
+
+    def wait_for_worker(self, generation=None):
+        """Wait until the worker's idle work (bases, region sweep) is done, and mix generation is displayed."""
+        worker = self.window.mixing_worker
+        while not worker.is_idle() or (generation is not None and self.displayed != generation):
+            self.app.processEvents()
+
+    def load(self, width, height):
+        """Load a synthetic image of the given size into every input."""
+        window = self.window
+        window.reset()
+        window.uploaded_images = [synthetic_image(width, height, seed) for seed in range(globals.input_count)]
+        window.image_hashes = [f"bench-{width}x{height}-{seed}" for seed in range(globals.input_count)]
+        window.update_smallest_dimensions()
+        for i in range(globals.input_count):
+            window.ingest(i)
+        self.wait_for_ingestion()
+        globals.spectra.weights[:] = np.linspace(0.5, 0.9, globals.input_count)
+
+    def ingest(self):
+        window = self.window
+
+        def forget():
+            window.ingest_cache.clear()
+            window.ingested_keys = [None] * globals.input_count
+
+        def run():
+            for i in range(globals.input_count):
+                window.ingest(i)
+            self.wait_for_ingestion()
+
+        return best_time(run, self.repeat, forget)
+
+    def calculate_ft(self):
+        label = self.window.image_labels[0]
+        return best_time(lambda: label.calculate_ft(0), self.repeat)
+
+    def plot_ft_component(self, component):
+        label = self.window.image_labels[0]
+        spectrum = globals.spectra.get(0).copy()
+        # Re-registering the spectrum drops its memoized components, as after an upload
+        return best_time(lambda: label.plot_ft_component(component, 0), self.repeat,
+                         lambda: label.set_ft(0, spectrum))
+
+    def apply_region(self, region):
+        region_type = {"Whole FT": None, "Inner region": "inner", "Outer region": "outer"}[region]
+        spectrum = globals.spectra.get(0).copy()
+        target = {}
+
+        def fresh_copy():
+            # The region is applied in place
+            target["ft"] = spectrum.copy()
+
+        return best_time(lambda: self.window.apply_region(target["ft"], REGION_SIZE, region_type), self.repeat,
+                         fresh_copy)
+
+    def select(self, mode, region):
+        window = self.window
+        window.mode_selector.setCurrentText(mode)
+        for i, combo in enumerate(window.combos):
+            combo.setCurrentText(MODES[mode][i % 2])
+        window.region_selector.setCurrentText(region)
+        window.region_size_slider.setValue(REGION_SIZE)
+
+    def apply_mixing(self, mode, region, cached=False):
+        window = self.window
+        worker = window.mixing_worker
+        self.select(mode, region)
+        # Full mixes only: no precomputed region outputs, and no sweep competing for the CPU
+        worker.sweep_regions = False
+        worker.sweep_cache.clear()
+
+        def settle():
+            # Let the worker finish the basis images of the previous mix
+            self.wait_for_worker()
+            if not cached:
+                worker.forget_caches()
+
+        def run():
+            window.apply_mixing()
+            generation = worker.generation
+            while self.displayed != generation:
+                self.app.processEvents()
+
+        return best_time(run, self.repeat, settle)
+
+    def scrub_region(self, mode, region):
+        window = self.window
+        self.select(mode, region)
+        window.mixing_worker.sweep_regions = True
+        window.mixing_worker.sweep_cache.clear()
+        window.apply_mixing()
+        self.wait_for_worker(window.mixing_worker.generation)
+
+        sizes = iter(range(10 ** 9))
+
+        def run():
+            window.region_size_slider.setValue(next(sizes) % 101)
+
+        return best_time(run, self.repeat)
+
+    def run_size(self, width, height):
+        """Run every case at one image size; returns {case name: seconds}."""
+        self.load(width, height)
+        size = f"{width}x{height}"
+        results = {f"ingest/{size}": self.ingest(), f"calculate_ft/{size}": self.calculate_ft()}
+        for component in mixer.COMPONENTS:
+            results[f"plot_ft_component[{component}]/{size}"] = self.plot_ft_component(component)
+        for region in REGIONS:
+            results[f"apply_region[{region}]/{size}"] = self.apply_region(region)
+        for mode in MODES:
+            for region in REGIONS:
+                results[f"apply_mixing[{mode},{region}]/{size}"] = self.apply_mixing(mode, region)
+                results[f"apply_mixing_cached[{mode},{region}]/{size}"] = self.apply_mixing(mode, region, cached=True)
+            for region in REGIONS[1:]:
+                results[f"scrub_region[{mode},{region}]/{size}"] = self.scrub_region(mode, region)
+        return results
+
+    def close(self):
+        self.window.close()
+
+
+def environment():
+    """Describe the machine and libraries the results were measured with."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "fft_backend": fft_backend.describe(),
+        "half_spectrum": globals.half_spectrum,
+        "single_precision": globals.single_precision,
+        "inputs": globals.input_count,
+    }
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Return [(case, baseline seconds, seconds)] for cases slower than the baseline by more than threshold."""
+    regressions = []
+    for case, seconds in results.items():
+        reference = baseline.get(case)
+        if reference is None:
+            continue
+        if seconds > reference * (1 + threshold) and seconds - reference > min_delta:
+            regressions.append((case, reference, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"image sizes as WxH,... (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case; the fastest is kept")
+    parser.add_argument("--half-spectrum", action="store_true", help="benchmark with half spectra")
+    parser.add_argument("--single-precision", action="store_true", help="benchmark in complex64")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to check the results against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    globals.half_spectrum = args.half_spectrum
+    globals.single_precision = args.single_precision
+
+    bench = Bench(app, args.repeat)
+    results = {}
+    try:
+        for width, height in parse_sizes(args.sizes):
+            # The application's debug prints would drown the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                size_results = bench.run_size(width, height)
+            for case, seconds in size_results.items():
+                print(f"{case:56s} {1000 * seconds:9.2f} ms")
+            results.update(size_results)
+    finally:
+        bench.close()
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump({"environment": environment(), "results": results}, baseline_file, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} results to {args.save}.")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("environment") != environment():
+            print(f"Note: the baseline was measured in a different environment: {baseline.get('environment')}")
+        regressions = compare(results, baseline["results"], args.threshold, args.min_delta_ms / 1000)
+        for case, reference, seconds in regressions:
+            print(f"REGRESSION {case}: {1000 * reference:.2f} ms -> {1000 * seconds:.2f} ms "
+                  f"({100 * (seconds / reference - 1):+.0f}%)")
+        if regressions:
+            print(f"FAILED: {len(regressions)} case(s) slowed down by more than {100 * args.threshold:.0f}%.")
+            return 1
+        print(f"OK: no case slowed down by more than {100 * args.threshold:.0f}% against {args.compare}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+import instrumentation
+
+# How each FT component is derived from a complex spectrum into an output buffer;
+# Real and Imaginary are views and need no buffer
+EXTRACTORS = {
+    "Magnitude": lambda spectrum, out: np.abs(spectrum, out=out),
+    "Phase": lambda spectrum, out: np.arctan2(spectrum.imag, spectrum.real, out=out),
+    "Real": lambda spectrum, out: spectrum.real,
+    "Imaginary": lambda spectrum, out: spectrum.imag,
+}
+BUFFERED_COMPONENTS = ("Magnitude", "Phase")
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ComponentStore:
+    """Lazily derived, memoized FT components with a memory budget.
+
+    A component is computed the first time it is requested and kept until its
+    source spectrum changes or it is evicted. When the memoized components
+    exceed max_bytes, the least recently used ones are dropped; the component
+    being returned is never evicted, so a single oversized request still works.
+    Component buffers come from allocator(shape, dtype), e.g. a SpillManager's
+    empty(); memory-mapped components do not count against max_bytes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, allocator=np.empty):
+        self.max_bytes = max_bytes
+        self.allocator = allocator
+        self._spectra = {}
+        self._entries = OrderedDict()  # (index, component) -> array, oldest first
+        self._lock = threading.Lock()
+
+    def set_spectrum(self, index, spectrum, components=None):
+        """Register the spectrum for an input, dropping components derived from the old one.
+
+        components optionally seeds the store with already derived components
+        of this spectrum, as a {component: array} dict.
+        """
+        with self._lock:
+            self._invalidate(index)
+            if spectrum is None:
+                self._spectra.pop(index, None)
+                return
+            self._spectra[index] = spectrum
+            for component, value in (components or {}).items():
+                self._entries[(index, component)] = value
+            self._evict()
+
+    def spectrum(self, index):
+        """Return the spectrum registered for an input, or None."""
+        return self._spectra.get(index)
+
+    def get(self, index, component):
+        """Return a component of an input's spectrum, deriving it on first use."""
+        with self._lock:
+            key = (index, component)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            spectrum = self._spectra.get(index)
+            if spectrum is None:
+                return None
+            if component not in EXTRACTORS:
+                raise ValueError(f"Unknown FT component: {component}")
+
+            out = None
+            if component in BUFFERED_COMPONENTS:
+                out = self.allocator(spectrum.shape, spectrum.real.dtype)
+                instrumentation.allocated("component_extraction", out.nbytes)
+            with instrumentation.span("component_extraction"):
+                value = EXTRACTORS[component](spectrum, out)
+            self._entries[key] = value
+            self._evict(keep=key)
+            return value
+
+    def level(self, index, component, level):
+        """Return a pyramid level of a component.
+
+        Level 0 is the full-resolution component; each further level halves
+        both axes by 2x2 block averaging and is memoized like a component.
+        """
+        if level == 0:
+            return self.get(index, component)
+
+        key = (index, component, level)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            spectrum = self._spectra.get(index)
+
+        finer = self.level(index, component, level - 1)
+        if finer is None:
+            return None
+        with instrumentation.span("component_pyramid"):
+            value = block_reduce(finer, 2, 2)
+        instrumentation.allocated("component_pyramid", value.nbytes)
+
+        with self._lock:
+            # Only memoize if the source spectrum did not change meanwhile
+            if self._spectra.get(index) is spectrum:
+                self._entries[key] = value
+                self._evict(keep=key)
+        return value
+
+    def set_budget(self, max_bytes):
+        """Change the memory budget, evicting immediately if it shrank."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    @property
+    def nbytes(self):
+        """Current memory footprint of the memoized components, in bytes."""
+        return sum(_owned_nbytes(value) for value in self._entries.values())
+
+    def clear(self):
+        """Forget all spectra and components."""
+        with self._lock:
+            self._spectra.clear()
+            self._entries.clear()
+
+    def _invalidate(self, index):
+        for key in [key for key in self._entries if key[0] == index]:
+            del self._entries[key]
+
+    def _evict(self, keep=None):
+        total = self.nbytes
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= _owned_nbytes(self._entries.pop(key))
+
+
+def block_reduce(array, factor_y, factor_x):
+    """Average non-overlapping factor_y x factor_x blocks, dropping any partial edge blocks."""
+    if factor_y == 1 and factor_x == 1:
+        return array
+    rows = array.shape[0] // factor_y
+    cols = array.shape[1] // factor_x
+    blocks = array[:rows * factor_y, :cols * factor_x].reshape(rows, factor_y, cols, factor_x)
+    return blocks.mean(axis=(1, 3))
+
+
+def _owned_nbytes(value):
+    """RAM held by a component.
+
+    Real and Imaginary are views into the spectrum and memory-mapped components
+    live in scratch files (their base is the mmap), so neither counts.
+    """
+    return 0 if value.base is not None else value.nbytes
@@ -0,0 +1,87 @@
+import importlib.util
+import os
+
+import numpy as np
+
+import instrumentation
+
+# Environment variables read the first time a transform runs
+BACKEND_ENV = "IMAGE_EQUALIZER_FFT_BACKEND"   # auto, pyfftw, scipy or numpy
+WORKERS_ENV = "IMAGE_EQUALIZER_FFT_WORKERS"   # threads per transform, defaults to all cores
+
+# Preferred order when autodetecting
+BACKENDS = ("pyfftw", "scipy", "numpy")
+
+_backend = None
+_workers = 1
+_module = None
+
+
+def available_backends():
+    """Return the backends that can be used in this environment, best first."""
+    return [name for name in BACKENDS if name == "numpy" or importlib.util.find_spec(name) is not None]
+
+
+def set_backend(name="auto", workers=None):
+    """Select the FFT backend ("auto" picks the best available) and its worker count."""
+    global _backend, _workers, _module
+
+    if name == "auto":
+        name = available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f"FFT backend {name!r} is not available (choose from {available_backends()})")
+
+    if name == "pyfftw":
+        import pyfftw.interfaces.cache
+        import pyfftw.interfaces.numpy_fft
+        pyfftw.interfaces.cache.enable()  # Keep FFTW plans alive between calls
+        _module = pyfftw.interfaces.numpy_fft
+    elif name == "scipy":
+        import scipy.fft
+        _module = scipy.fft
+    else:
+        _module = np.fft
+
+    _backend = name
+    _workers = max(1, int(workers or os.cpu_count() or 1))
+    instrumentation.log("FFT backend: %s", describe())
+
+
+def active_backend():
+    """Return the name of the active backend, configuring it from the environment if needed."""
+    if _backend is None:
+        set_backend(os.environ.get(BACKEND_ENV, "auto"), os.environ.get(WORKERS_ENV))
+    return _backend
+
+
+def describe():
+    """Human-readable description of the active backend."""
+    backend = active_backend()
+    if backend == "numpy":
+        return "numpy (single-threaded)"
+    return f"{backend} (workers={_workers})"
+
+
+def _call(function, a, **kwargs):
+    backend = active_backend()
+    if backend == "scipy":
+        kwargs["workers"] = _workers
+    elif backend == "pyfftw":
+        kwargs["threads"] = _workers
+    return getattr(_module, function)(a, **kwargs)
+
+
+def fft2(a):
+    return _call("fft2", a)
+
+
+def ifft2(a):
+    return _call("ifft2", a)
+
+
+def rfft2(a):
+    return _call("rfft2", a)
+
+
+def irfft2(a, s=None):
+    return _call("irfft2", a, s=s)
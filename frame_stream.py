@@ -0,0 +1,338 @@
+"""Mix frame sequences (animated GIFs, frame directories, image stacks) with one recipe.
+
+Usage:
+    python frame_stream.py RECIPE INPUT [INPUT ...] --output DIR [--fps F]
+
+Every INPUT is an animated GIF or multi-page TIFF, a directory of numbered
+frames, a .npy stack of shape (frames, height, width), or a still image, which
+is used for every frame. RECIPE is a batch_mix recipe with one entry per
+INPUT. Frame t of the output mixes frame t of every input, resized to their
+smallest common size, and the output is as long as the shortest sequence.
+Frames are written to DIR/frame_000000.png, ... With --fps, frames are paced
+to that rate and those the pipeline cannot keep up with are dropped.
+"""
+import argparse
+import glob
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import batch_mix
+import instrumentation
+import mixer
+from workspace import Workspace
+
+FRAME_PATTERNS = batch_mix.IMAGE_PATTERNS + ("*.tif", "*.tiff")
+
+# Frames a stage may run ahead of the next one: while one frame is handed over, the next is prepared
+QUEUE_DEPTH = 2
+
+_END = object()  # Passed down the pipeline after the last frame
+
+
+def numbered_frames(directory):
+    """The frame files of a directory, in natural order (frame2 before frame10)."""
+    paths = {path for pattern in FRAME_PATTERNS for path in glob.glob(os.path.join(directory, pattern))}
+    return sorted(paths, key=lambda path: [int(part) if part.isdigit() else part
+                                           for part in re.split(r"(\d+)", os.path.basename(path))])
+
+
+def open_frame(path):
+    """The first frame of any supported input, as a Pillow image (files are only opened, not decoded)."""
+    if os.path.isdir(path) or path.endswith(".npy"):
+        return FrameSequence(path).frame(0)
+    return Image.open(path)
+
+
+class FrameSequence:
+    """The grayscale frames of one input, decoded on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self._paths = None  # Frame directory
+        self._stack = None  # .npy stack
+        self._image = None  # Multi-frame (or still) image file
+        self._lock = threading.Lock()  # Seeking a Pillow image changes its state
+
+        if os.path.isdir(path):
+            self._paths = numbered_frames(path)
+            if not self._paths:
+                raise ValueError(f"No frames found in {path}")
+            self.length = len(self._paths)
+        elif path.endswith(".npy"):
+            stack = np.load(path, mmap_mode="r")
+            if stack.ndim == 2:
+                stack = stack[np.newaxis]
+            if stack.ndim != 3:
+                raise ValueError(f"{path}: expected a (frames, height, width) stack, got shape {stack.shape}")
+            self._stack = stack
+            self.length = len(stack)
+        else:
+            self._image = Image.open(path)
+            self.length = getattr(self._image, "n_frames", 1)
+
+    def __len__(self):
+        return self.length
+
+    def frame(self, index):
+        """Decode frame index as a grayscale ("L") Pillow image."""
+        with instrumentation.span("decode"):
+            if self._paths is not None:
+                return Image.open(self._paths[index]).convert("L")
+            if self._stack is not None:
+                frame = self._stack[index]
+                if frame.dtype != np.uint8:
+                    frame = np.clip(frame, 0, 255).astype(np.uint8)
+                return Image.fromarray(np.ascontiguousarray(frame))
+            with self._lock:
+                self._image.seek(index)
+                return self._image.convert("L")
+
+
+class StreamMixer:
+    """Mix frame sequences through a pipeline of overlapping stages.
+
+    Decoding and resizing, the forward FFTs, the mix with its inverse FFT and
+    the sink each run on their own thread, joined by queues of QUEUE_DEPTH
+    frames: while a stage works on frame t, the one before it already prepares
+    frame t + 1, and a stage that gets QUEUE_DEPTH frames ahead waits. Still
+    images (one-frame inputs) are decoded and transformed only once, and keep
+    their stamp, so the mixer reuses what it derived from them.
+
+    With fps, frames are paced to that rate from the moment the first frame
+    reaches the sink: the decoder skips frames that are already overdue, and
+    frames that reach the sink more than one frame interval late are dropped
+    (except the last one). Without fps every frame is mixed, as fast as the
+    slowest stage allows.
+
+    sink(frame index, uint8 image) and finished() are called on the sink
+    thread; finished is called once, after the last frame, a stop() or an
+    error (kept in error).
+    """
+
+    def __init__(self, sequences, recipe, sink, fps=None, finished=None):
+        if len(sequences) != len(recipe["inputs"]):
+            raise ValueError(f"The recipe has {len(recipe['inputs'])} inputs, but {len(sequences)} were given")
+        self.sequences = sequences
+        self.recipe = recipe
+        self.sink = sink
+        self.fps = fps
+        self.finished = finished
+        lengths = [len(sequence) for sequence in sequences if len(sequence) > 1]
+        self.length = min(lengths) if lengths else 1
+
+        self.frames_mixed = 0
+        self.frames_dropped = 0
+        self._dropped_lock = threading.Lock()  # The decoder and the sink both drop frames
+        self.error = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._started = False
+        self._clock = None  # When frame 0 is due, set by the sink's first frame
+        self._threads = []
+
+    def start(self):
+        """Start the pipeline threads."""
+        decoded, transformed, mixed = (queue.Queue(QUEUE_DEPTH) for _ in range(3))
+        stages = [
+            ("decode", self._decode_stage, (decoded,)),
+            ("fft", self._fft_stage, (decoded, transformed)),
+            ("mix", self._mix_stage, (transformed, mixed)),
+            ("sink", self._sink_stage, (mixed,)),
+        ]
+        self._started = True
+        for name, stage, queues in stages:
+            thread = threading.Thread(target=self._run_stage, args=(stage, queues),
+                                      name=f"stream-{name}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self):
+        """Stop the pipeline; the frame being handed to the sink may still arrive."""
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Wait for the pipeline to finish; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def is_running(self):
+        return self._started and not self._done.is_set()
+
+    def _run_stage(self, stage, queues):
+        try:
+            stage(*queues)
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+                print(f"Frame stream failed: {e}")
+            self._stop.set()  # The other stages wind down at their next queue operation
+        if stage == self._sink_stage:
+            self._done.set()
+            if self.finished is not None:
+                self.finished()
+
+    def _put(self, target, item):
+        """Queue item, waiting while target is full; returns False once the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, source):
+        """The next item of source, or _END once the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _dropped(self, count):
+        with self._dropped_lock:
+            self.frames_dropped += count
+
+    def _due_frame(self):
+        """The frame that should be on screen now at the target frame rate (-1 before the first one)."""
+        clock = self._clock
+        if clock is None:
+            return -1
+        return int((time.perf_counter() - clock) * self.fps)
+
+    def _decode_stage(self, decoded):
+        first_frames = [sequence.frame(0) for sequence in self.sequences]
+        # The smallest common size, as for the application's inputs
+        size = (min(frame.size[0] for frame in first_frames), min(frame.size[1] for frame in first_frames))
+
+        def resized(frame):
+            if frame.size == size:
+                return np.asarray(frame)
+            with instrumentation.span("resize"):
+                return np.asarray(frame.resize(size, Image.Resampling.LANCZOS))
+
+        still = {i: resized(frame) for i, (sequence, frame) in enumerate(zip(self.sequences, first_frames))
+                 if len(sequence) == 1}
+        index = 0
+        while index < self.length:
+            if self.fps and index > 0:
+                # Skip the frames that are already overdue
+                due = min(self._due_frame(), self.length - 1)
+                if due > index:
+                    self._dropped(due - index)
+                    index = due
+            frames = [still[i] if i in still else
+                      resized(first_frames[i] if index == 0 else sequence.frame(index))
+                      for i, sequence in enumerate(self.sequences)]
+            if not self._put(decoded, (index, frames)):
+                return
+            index += 1
+        self._put(decoded, _END)
+
+    def _fft_stage(self, decoded, transformed):
+        half_spectrum = self.recipe.get("half_spectrum", False)
+        single_precision = self.recipe.get("single_precision", False)
+        still_spectra = {}
+        stamp = len(self.sequences)  # Stamps 0..N-1 are the still inputs'
+        while True:
+            item = self._get(decoded)
+            if item is _END:
+                self._put(transformed, _END)
+                return
+            index, frames = item
+            spectra, stamps = [], []
+            for i, frame in enumerate(frames):
+                if len(self.sequences[i]) == 1:
+                    if i not in still_spectra:
+                        still_spectra[i] = mixer.forward(frame, half_spectrum, single_precision)
+                    spectra.append(still_spectra[i])
+                    stamps.append(i)
+                else:
+                    spectra.append(mixer.forward(frame, half_spectrum, single_precision))
+                    stamp += 1
+                    stamps.append(stamp)
+            image_shape = frames[0].shape if half_spectrum else None
+            if not self._put(transformed, (index, spectra, stamps, image_shape)):
+                return
+
+    def _mix_stage(self, transformed, mixed):
+        workspace = Workspace()
+        incremental_mixer = mixer.IncrementalMixer(workspace)
+        recipe = self.recipe
+        weights = [spec["weight"] for spec in recipe["inputs"]]
+        components = [spec["component"] for spec in recipe["inputs"]]
+        while True:
+            item = self._get(transformed)
+            if item is _END:
+                self._put(mixed, _END)
+                return
+            index, spectra, stamps, image_shape = item
+            mixed_ft = incremental_mixer.mix_spectra(spectra, weights, components, recipe["mode"],
+                                                     recipe["region"]["type"], recipe["region"]["size"],
+                                                     image_shape, stamps)
+            if mixed_ft is None:
+                raise ValueError("no input contributes to the mix")
+            if not self._put(mixed, (index, mixer.reconstruct(mixed_ft, image_shape, workspace))):
+                return
+
+    def _sink_stage(self, mixed):
+        interval = 1 / self.fps if self.fps else 0
+        while True:
+            item = self._get(mixed)
+            if item is _END:
+                return
+            index, image = item
+            if self.fps:
+                if self._clock is None:
+                    self._clock = time.perf_counter() - index * interval
+                late = time.perf_counter() - (self._clock + index * interval)
+                if late > interval and index < self.length - 1:
+                    self._dropped(1)
+                    continue
+                if late < 0 and self._stop.wait(-late):
+                    return
+            self.sink(index, image)
+            self.frames_mixed += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recipe", help="JSON or YAML recipe file (see batch_mix.py)")
+    parser.add_argument("inputs", nargs="+", help="frame sequences or still images, in recipe order")
+    parser.add_argument("--output", required=True, help="directory for the mixed frames")
+    parser.add_argument("--fps", type=float, default=None, help="target frame rate; late frames are dropped")
+    args = parser.parse_args(argv)
+
+    recipe = batch_mix.load_recipe(args.recipe)
+    try:
+        sequences = [FrameSequence(path) for path in args.inputs]
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Cannot read the inputs: {e}")
+    os.makedirs(args.output, exist_ok=True)
+
+    def write(index, image):
+        Image.fromarray(image).save(os.path.join(args.output, f"frame_{index:06d}.png"))
+
+    try:
+        stream = StreamMixer(sequences, recipe, write, args.fps)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    start = time.perf_counter()
+    stream.start()
+    stream.wait()
+    seconds = time.perf_counter() - start
+
+    print(f"Mixed {stream.frames_mixed} of {stream.length} frames in {seconds:.1f}s "
+          f"({stream.frames_mixed / seconds if seconds else 0:.1f} frames/s, {stream.frames_dropped} dropped).")
+    return 1 if stream.error is not None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,16 @@
+import os
+
+from component_store import ComponentStore
+from spectrum_stack import SpectrumStack
+from spill import SpillManager
+
+INPUTS_ENV = "IMAGE_EQUALIZER_INPUTS"  # Number of input viewers, 4 by default
+
 # Define global variables
+input_count = max(1, int(os.environ.get(INPUTS_ENV) or 4))
 ft_labels = []   # Store FT QLabel references
-ft_images = [None] * 4  # Store Fourier Transform images
-ft_sliders = [0, 0, 0, 0]
-ft_components = [{"Magnitude": None, "Phase": None, "Real": None, "Imaginary": None} for _ in range(4)]
+spill = SpillManager.from_environment()  # Moves spectra and components to scratch files past the RAM ceiling
+spectra = SpectrumStack(input_count, allocator=spill.empty)  # Spectra, weights and component selections of all inputs
+ft_components = ComponentStore(allocator=spill.empty)  # Lazily derived FT components, memoized under a memory budget
+half_spectrum = False  # Keep only the rfft2 half plane of each spectrum
+single_precision = False  # Keep spectra, components and mixing buffers in complex64/float32
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PIL import Image
+import numpy as np
+
+import instrumentation
+import mixer
+
+
+def prepare_input(image, target_size, half_spectrum=False, single_precision=False):
+    """Resample an uploaded image and compute its spectrum and magnitude (runs off the GUI thread)."""
+    if image.mode != "L":
+        # Restored sessions hand over lazily opened files, decoded only when needed
+        with instrumentation.span("decode"):
+            image = image.convert("L")
+    with instrumentation.span("resize"):
+        resized_image = image.resize(target_size, Image.Resampling.LANCZOS)
+    ft_image = mixer.forward(np.asarray(resized_image), half_spectrum, single_precision)
+    with instrumentation.span("component_extraction"):
+        magnitude = np.abs(ft_image)
+    instrumentation.allocated("component_extraction", magnitude.nbytes)
+    return {
+        "image": resized_image,
+        "ft_image": ft_image,
+        "components": {"Magnitude": magnitude},  # The component shown after an upload
+    }
+
+
+class IngestionPool(QObject):
+    """Prepare several inputs in parallel and hand each one to the GUI thread as it finishes.
+
+    Resampling and FFTs release the GIL, so a thread pool keeps the inputs'
+    shared buffers in one process and still uses several cores.
+    """
+
+    ready = pyqtSignal(int, object, object)  # index, ingestion key, prepare_input result (None on failure)
+
+    def __init__(self, parent=None, max_workers=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1))
+
+    def submit(self, index, key, image, target_size, half_spectrum=False, single_precision=False,
+               cache=None, cache_name=None):
+        """Queue input index for preparation; ready is emitted with key when it is done.
+
+        With a SpectrumCache, the result is also written to it under cache_name,
+        as a separate pool task queued once ready has been emitted.
+        """
+        future = self.executor.submit(prepare_input, image, target_size, half_spectrum, single_precision)
+        future.add_done_callback(lambda future: self._deliver(index, key, future, cache, cache_name))
+
+    def shutdown(self):
+        """Drop queued work and wait for running preparations to finish."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _deliver(self, index, key, future, cache, cache_name):
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Failed to prepare image {index + 1}: {e}")
+            result = None
+        # The GUI may add components to the result before the cache write runs
+        stored = dict(result, components=dict(result["components"])) if result is not None else None
+        # Emitted from a pool thread, so the GUI receives it through a queued connection
+        self.ready.emit(index, key, result)
+        if cache is not None and stored is not None:
+            try:
+                self.executor.submit(cache.store, cache_name, stored)
+            except RuntimeError:
+                pass  # The pool was shut down in the meantime: the entry is just not cached
@@ -0,0 +1,149 @@
+"""Named timing spans, allocation counters and debug messages for the hot paths.
+
+Everything is off by default: span() then returns a shared no-op context
+manager and allocated()/log() return immediately, so instrumented code pays
+one flag check. Set IMAGE_EQUALIZER_TRACE=1 (or call enable()) to record.
+
+    with instrumentation.span("forward_fft"):
+        ...
+    instrumentation.allocated("forward_fft", spectrum.nbytes)
+    instrumentation.log("FT image calculated: %s", spectrum.shape)
+
+Recorded spans can be summarized per name, or exported as JSON or as a
+Chrome trace (chrome://tracing, https://ui.perfetto.dev).
+"""
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = "IMAGE_EQUALIZER_TRACE"  # 1 to record from startup
+
+MAX_EVENTS = 100000  # Oldest spans are dropped beyond this
+
+enabled = os.environ.get(TRACE_ENV, "") not in ("", "0")
+
+_NULL_SPAN = contextlib.nullcontext()
+_events = collections.deque(maxlen=MAX_EVENTS)  # (name, thread id, start ns, duration ns)
+_allocations = collections.Counter()  # site -> bytes
+_allocation_counts = collections.Counter()  # site -> number of allocations
+_thread_names = {}
+_lock = threading.Lock()
+_origin = time.perf_counter_ns()
+
+
+def enable(on=True):
+    """Start (or with on=False, stop) recording."""
+    global enabled
+    enabled = on
+
+
+def clear():
+    """Forget everything recorded so far."""
+    with _lock:
+        _events.clear()
+        _allocations.clear()
+        _allocation_counts.clear()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter_ns() - self.start
+        thread = threading.current_thread()
+        _thread_names[thread.ident] = thread.name
+        _events.append((self.name, thread.ident, self.start - _origin, duration))
+        return False
+
+
+def span(name):
+    """Context manager timing the enclosed block as a span called name."""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def allocated(site, nbytes):
+    """Count an allocation of nbytes made at site."""
+    if not enabled:
+        return
+    with _lock:
+        _allocations[site] += int(nbytes)
+        _allocation_counts[site] += 1
+
+
+def log(message, *args):
+    """Print a debug message (formatted with % args only when recording)."""
+    if enabled:
+        print(message % args if args else message)
+
+
+def summary():
+    """Return {"spans": {name: stats}, "allocations": {site: stats}}; times in milliseconds."""
+    spans = {}
+    for name, _, _, duration in list(_events):
+        stats = spans.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        milliseconds = duration / 1e6
+        stats["count"] += 1
+        stats["total_ms"] += milliseconds
+        stats["max_ms"] = max(stats["max_ms"], milliseconds)
+        stats["last_ms"] = milliseconds
+    for stats in spans.values():
+        stats["mean_ms"] = stats["total_ms"] / stats["count"]
+
+    with _lock:
+        allocations = {site: {"count": _allocation_counts[site], "bytes": nbytes}
+                       for site, nbytes in _allocations.items()}
+    return {"spans": spans, "allocations": allocations}
+
+
+def format_summary():
+    """Multi-line text table of summary(), slowest spans first."""
+    data = summary()
+    lines = [f"{'span':22s} {'n':>5s} {'last':>8s} {'mean':>8s} {'max':>8s}"]
+    for name, stats in sorted(data["spans"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(f"{name:22s} {stats['count']:5d} {stats['last_ms']:8.2f} "
+                     f"{stats['mean_ms']:8.2f} {stats['max_ms']:8.2f}")
+    if data["allocations"]:
+        lines.append(f"{'allocation':22s} {'n':>5s} {'MB':>8s}")
+        for site, stats in sorted(data["allocations"].items()):
+            lines.append(f"{site:22s} {stats['count']:5d} {stats['bytes'] / 2**20:8.1f}")
+    return "\n".join(lines)
+
+
+def export_json(path):
+    """Write the summary and every recorded span to path as JSON."""
+    events = [{"name": name, "thread": _thread_names.get(thread, str(thread)),
+               "start_ms": start / 1e6, "duration_ms": duration / 1e6}
+              for name, thread, start, duration in list(_events)]
+    with open(path, "w") as output:
+        json.dump({"summary": summary(), "events": events}, output, indent=2)
+
+
+def export_chrome_trace(path):
+    """Write the recorded spans and allocation totals to path in the Chrome trace event format."""
+    pid = os.getpid()
+    trace = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}}
+             for thread, name in list(_thread_names.items())]
+    end = 0.0
+    for name, thread, start, duration in list(_events):
+        trace.append({"name": name, "cat": "image-equalizer", "ph": "X", "pid": pid, "tid": thread,
+                      "ts": start / 1e3, "dur": duration / 1e3})
+        end = max(end, (start + duration) / 1e3)
+    with _lock:
+        allocations = dict(_allocations)
+    if allocations:
+        trace.append({"name": "allocated MB", "ph": "C", "pid": pid, "ts": end,
+                      "args": {site: nbytes / 2**20 for site, nbytes in allocations.items()}})
+    with open(path, "w") as output:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, output)
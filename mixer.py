@@ -0,0 +1,636 @@
+import functools
+import os
+
+import numpy as np
+
+import fft_backend
+import instrumentation
+from workspace import Workspace
+
+# Mixing modes as they appear in the mode selector
+MAG_PHASE = "Mag/Phase"
+REAL_IMAG = "Real/Imag"
+
+COMPONENTS = ["Magnitude", "Phase", "Real", "Imaginary"]
+
+# Size of the row band of all inputs that mix_spectra stacks at a time
+MIX_BAND_BYTES = 64 * 1024 * 1024
+
+# Environment variable read by BasisMixer.from_environment()
+BASIS_BUDGET_ENV = "IMAGE_EQUALIZER_BASIS_MB"  # 0 disables the basis images
+
+# Default memory budget of the Real/Imag basis images (four 50 MP inputs take 800 MB)
+BASIS_MAX_BYTES = 1024 * 1024 * 1024
+
+# Components that flip sign at mirrored frequencies of a real image (the others are even)
+ODD_COMPONENTS = ("Phase", "Imaginary")
+
+
+def forward(np_image, half_spectrum=False, single_precision=False):
+    """Centered spectrum of a real image.
+
+    With half_spectrum, only the non-negative column frequencies are kept
+    (rfft2) and only the rows are shifted, so column 0 is the DC column.
+    With single_precision, the transform runs on float32 and the spectrum is
+    complex64; mixing then keeps that precision throughout.
+    """
+    if single_precision:
+        np_image = np.asarray(np_image, dtype=np.float32)
+        spectrum_dtype = np.complex64
+    else:
+        np_image = np.asarray(np_image, dtype=np.float64)
+        spectrum_dtype = np.complex128
+
+    with instrumentation.span("forward_fft"):
+        if half_spectrum:
+            spectrum = np.fft.fftshift(fft_backend.rfft2(np_image), axes=0)
+        else:
+            spectrum = np.fft.fftshift(fft_backend.fft2(np_image))
+        # Some backends always compute in double precision
+        spectrum = spectrum.astype(spectrum_dtype, copy=False)
+    instrumentation.allocated("forward_fft", spectrum.nbytes)
+    return spectrum
+
+
+def expand_half(half, width, component=None):
+    """Rebuild the full centered plane from a centered half plane.
+
+    With component=None, half is a complex spectrum and the missing columns are
+    filled with its Hermitian mirror. Otherwise half holds that FT component,
+    which is even (Magnitude, Real) or odd (Phase, Imaginary) under the mirror.
+    """
+    rows, columns = half.shape
+    unshifted = np.fft.ifftshift(half, axes=0)
+
+    # F[u, v] = conj(F[-u, width - v]) for the columns rfft2 left out
+    mirrored = unshifted[(-np.arange(rows)) % rows][:, width - np.arange(columns, width)]
+    if component is None:
+        mirrored = np.conj(mirrored)
+    elif component in ODD_COMPONENTS:
+        mirrored = -mirrored
+
+    full = np.concatenate([unshifted, mirrored], axis=1)
+    return np.fft.fftshift(full)
+
+
+def region_bounds(shape, region_size_percentage, image_shape=None):
+    """Return the (row, column) slices of the centered region for a given size percentage.
+
+    When image_shape is given, shape is taken to be its half plane and the column slice
+    covers the non-negative frequencies of the region, so the selection stays
+    symmetric once the half plane is mirrored.
+    """
+    rows, cols = shape[-2:]
+    half = image_shape is not None
+    if half:
+        cols = image_shape[-1]
+
+    # Half-size of the region on each axis
+    region_size_x = int((region_size_percentage / 100) * rows / 2)
+    region_size_y = int((region_size_percentage / 100) * cols / 2)
+
+    # Center of the (shifted) Fourier Transform
+    center_x, center_y = rows // 2, cols // 2
+
+    if half:
+        return (slice(center_x - region_size_x, center_x + region_size_x),
+                slice(0, region_size_y))
+    return (slice(center_x - region_size_x, center_x + region_size_x),
+            slice(center_y - region_size_y, center_y + region_size_y))
+
+
+@functools.lru_cache(maxsize=32)
+def region_mask(shape, region_size_percentage, region_type, image_shape=None):
+    """Return a cached, read-only boolean mask of the frequencies a region keeps.
+
+    Masks are keyed by (shape, size percentage, region type), so scrubbing back
+    and forth over the same sizes does not allocate. apply_region itself does
+    not need a mask; this is for callers that multiply by the region.
+    """
+    row_slice, col_slice = region_bounds(shape, region_size_percentage, image_shape)
+    mask = np.zeros(shape[-2:], dtype=bool)
+    mask[row_slice, col_slice] = True
+    if region_type == "outer":
+        mask = ~mask
+    mask.setflags(write=False)
+    return mask
+
+
+def apply_region(complex_ft, region_size_percentage, region_type, image_shape=None):
+    """Apply the region selection (inner or outer) to a centered spectrum, in place.
+
+    The region is a rectangle, so it is applied with direct slice writes and
+    no full-size temporaries.
+    """
+    if region_type not in ("inner", "outer"):
+        return complex_ft
+
+    row_slice, col_slice = region_bounds(complex_ft.shape, region_size_percentage, image_shape)
+
+    with instrumentation.span("region_mask"):
+        if region_type == "inner":
+            # Keep only the low frequencies (center region): zero the bands around it
+            complex_ft[..., :row_slice.start, :] = 0
+            complex_ft[..., row_slice.stop:, :] = 0
+            complex_ft[..., row_slice, :col_slice.start] = 0
+            complex_ft[..., row_slice, col_slice.stop:] = 0
+        else:
+            # Keep only the high frequencies (outer region): zero the center
+            complex_ft[..., row_slice, col_slice] = 0
+    return complex_ft
+
+
+def _gather(spectra, rows, band):
+    """One row band of the given inputs as an (len(rows), band rows, W) array.
+
+    Consecutive inputs of an (N, H, W) array are a view; anything else is stacked.
+    """
+    if isinstance(spectra, np.ndarray):
+        if rows[-1] - rows[0] == len(rows) - 1:
+            return spectra[rows[0]:rows[-1] + 1, band]
+        return spectra[rows, band]
+    return np.stack([spectra[i][band] for i in rows])
+
+
+def _spectra_dtype(spectra):
+    """The common dtype of an (N, H, W) array or a list of spectra."""
+    return spectra.dtype if isinstance(spectra, np.ndarray) else np.result_type(*[s.dtype for s in spectra])
+
+
+def mix_spectra(spectra, weights, components, mode, region_type=None, region_size_percentage=50,
+                image_shape=None, out=None):
+    """Mix a stack of centered spectra into a single centered spectrum.
+
+    spectra is an (N, H, W) complex array or a list of N (H, W) spectra, weights
+    an (N,) array of slider weights in [0, 1] and components the FT component
+    selected for each input. Pass the spatial image_shape only when spectra are
+    half planes from forward(). Inputs whose component does not belong to the
+    mode are ignored. The mix is computed in the precision of the spectra
+    (complex64 or complex128), into out if given.
+
+    Each component is a single weighted reduction over the input axis. The
+    inputs are reduced in row bands of about MIX_BAND_BYTES, so memory-mapped
+    spectra are paged in band by band, and only one band of the contributing
+    inputs is ever copied (none when they are consecutive rows of an array).
+    Returns None when no input contributes to the mix.
+    """
+    if len(spectra) == 0 or spectra[0].ndim != 2:
+        return None
+
+    components = np.asarray(components)
+    if mode == MAG_PHASE:
+        first_group, second_group = components == "Magnitude", components == "Phase"
+    elif mode == REAL_IMAG:
+        first_group, second_group = components == "Real", components == "Imaginary"
+    else:
+        raise ValueError(f"Unknown mixing mode: {mode}")
+    if not (first_group.any() or second_group.any()):
+        return None
+
+    dtype = _spectra_dtype(spectra)
+    weights = np.asarray(weights, dtype=np.finfo(dtype).dtype)
+    first_rows, second_rows = np.flatnonzero(first_group), np.flatnonzero(second_group)
+    first_weights, second_weights = weights[first_rows], weights[second_rows]
+
+    shape = spectra[0].shape
+    if out is not None:
+        mixed_ft = out
+    else:
+        mixed_ft = np.empty(shape, dtype)
+        instrumentation.allocated("mix", mixed_ft.nbytes)
+    band_rows = max(1, MIX_BAND_BYTES // ((len(first_rows) + len(second_rows)) * shape[1] * dtype.itemsize))
+
+    with instrumentation.span("mix"):
+        for start in range(0, shape[0], band_rows):
+            band = slice(start, start + band_rows)
+            mixed_band = mixed_ft[band]
+
+            if mode == MAG_PHASE:
+                if len(first_rows):
+                    # Weighted average of the selected magnitudes
+                    magnitude = np.tensordot(first_weights, np.abs(_gather(spectra, first_rows, band)), axes=1)
+                    magnitude /= len(first_rows)
+                else:
+                    # Without a magnitude source, borrow the first input's magnitude
+                    magnitude = np.abs(spectra[0][band])
+
+                if len(second_rows):
+                    # Weighted average of the selected phases
+                    phase = np.tensordot(second_weights, np.angle(_gather(spectra, second_rows, band)), axes=1)
+                    phase /= len(second_rows)
+                    # exp(j * phase) written straight into the output, without complex temporaries
+                    np.cos(phase, out=mixed_band.real)
+                    np.sin(phase, out=mixed_band.imag)
+                    mixed_band *= magnitude
+                else:
+                    mixed_band[...] = magnitude
+
+            else:
+                # Linear mode: weighted real parts plus j times the weighted imaginary parts
+                mixed_band.real = (np.tensordot(first_weights, _gather(spectra, first_rows, band).real, axes=1)
+                                   if len(first_rows) else 0)
+                mixed_band.imag = (np.tensordot(second_weights, _gather(spectra, second_rows, band).imag, axes=1)
+                                   if len(second_rows) else 0)
+
+    # The region is shared by all inputs, so apply it once to the combined spectrum
+    return apply_region(mixed_ft, region_size_percentage, region_type, image_shape)
+
+
+def _ifftshift(spectrum, half, workspace):
+    """np.fft.ifftshift of a centered spectrum (rows only for half planes), into a workspace buffer if given."""
+    if workspace is None:
+        return np.fft.ifftshift(spectrum, axes=0) if half else np.fft.ifftshift(spectrum)
+
+    shifted = workspace.buffer("mix.shifted", spectrum.shape, spectrum.dtype)
+    rows, cols = spectrum.shape
+    row_shift, col_shift = rows // 2, 0 if half else cols // 2
+    # Swap the quadrants around DC back to the corners
+    shifted[:rows - row_shift, :cols - col_shift] = spectrum[row_shift:, col_shift:]
+    shifted[:rows - row_shift, cols - col_shift:] = spectrum[row_shift:, :col_shift]
+    shifted[rows - row_shift:, :cols - col_shift] = spectrum[:row_shift, col_shift:]
+    shifted[rows - row_shift:, cols - col_shift:] = spectrum[:row_shift, :col_shift]
+    return shifted
+
+
+def inverse(mixed_ft, image_shape=None, workspace=None):
+    """Inverse transform a centered spectrum (a half plane if image_shape is given) into a real image.
+
+    With a workspace, the shifted copy of the spectrum goes into its "mix.shifted" buffer.
+    """
+    with instrumentation.span("inverse_fft"):
+        shifted = _ifftshift(mixed_ft, image_shape is not None, workspace)
+        if image_shape is not None:
+            # Hermitian by construction, so the inverse is real without dropping anything
+            return fft_backend.irfft2(shifted, s=image_shape)
+        return fft_backend.ifft2(shifted).real
+
+
+def to_uint8(image):
+    """Clip a real image to the displayable range."""
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def reconstruct(mixed_ft, image_shape=None, workspace=None):
+    """Inverse transform a centered spectrum (a half plane if image_shape is given) into a uint8 image."""
+    image = inverse(mixed_ft, image_shape, workspace)
+    # The inverse is a temporary of its own, so it is clipped in place
+    return np.clip(image, 0, 255, out=image).astype(np.uint8)
+
+
+def mix(spectra, weights, components, mode, region_type=None, region_size_percentage=50,
+        image_shape=None):
+    """Mix a stack of centered spectra and return the resulting uint8 image, or None."""
+    mixed_ft = mix_spectra(spectra, weights, components, mode, region_type, region_size_percentage,
+                           image_shape)
+    if mixed_ft is None:
+        return None
+    return reconstruct(mixed_ft, image_shape)
+
+
+def preview(spectra, weights, components, mode, region_type=None, region_size_percentage=50,
+            image_shape=None, preview_shape=(200, 300)):
+    """Cheap low-resolution version of mix() for live feedback.
+
+    Only a centered preview_shape window of each spectrum around DC is mixed
+    and inverted, so the cost depends on the preview size, not the image size.
+    The region is still taken from the full-size spectrum. Returns a uint8
+    image of (at most) preview_shape, or None.
+    """
+    rows, cols = spectra[0].shape
+    full_shape = image_shape if image_shape is not None else (rows, cols)
+    preview_rows = min(rows, preview_shape[0])
+    preview_cols = min(full_shape[1], preview_shape[1])
+
+    # Window around DC; half planes already start at the DC column
+    top = rows // 2 - preview_rows // 2
+    if image_shape is not None:
+        left, window_cols = 0, preview_cols // 2 + 1
+    else:
+        left, window_cols = cols // 2 - preview_cols // 2, preview_cols
+    window = (slice(top, top + preview_rows), slice(left, left + window_cols))
+
+    cropped = np.stack([spectrum[window] for spectrum in spectra])
+    mixed_ft = mix_spectra(cropped, weights, components, mode)
+    if mixed_ft is None:
+        return None
+
+    if region_type in ("inner", "outer"):
+        mixed_ft[~region_mask(spectra[0].shape, region_size_percentage, region_type, image_shape)[window]] = 0
+
+    # The inverse transform normalizes by the window size, not the image size
+    mixed_ft *= (preview_rows * preview_cols) / (full_shape[0] * full_shape[1])
+    preview_image_shape = (preview_rows, preview_cols) if image_shape is not None else None
+    return reconstruct(mixed_ft, preview_image_shape)
+
+
+class MagPhaseMixer:
+    """Mag/Phase mixer that works in place in reusable buffers.
+
+    The weighted magnitude and the unit phasor exp(j * weighted phase) are
+    accumulated one input at a time into buffers kept between calls, and the
+    complex spectrum is built from them with a single multiply. Each of the
+    two is remembered with the stamps and weights it was made from, so
+    moving a magnitude slider reuses the phasor (no trigonometry at all) and
+    moving a phase slider reuses the magnitude. With a single phase source at
+    full weight, the phasor is F / |F| and needs no exponential either.
+
+    The buffers are the "mix.*" buffers of a Workspace. Only the magnitude,
+    the phasor and the output are full size; the inputs are read in row bands
+    of about MIX_BAND_BYTES through band-sized scratch buffers, as in
+    mix_spectra.
+    """
+
+    def __init__(self, workspace=None):
+        self.workspace = workspace if workspace is not None else Workspace()
+        self.reset()
+
+    def reset(self):
+        """Forget what the buffers hold."""
+        self._magnitude_source = (None, None)  # (key, buffer) of the accumulated magnitude
+        self._phasor_source = (None, None)  # (key, buffer) of the unit phasor
+
+    def _buffer(self, name, shape, dtype):
+        return self.workspace.buffer(f"mix.{name}", shape, dtype)
+
+    @staticmethod
+    def _holds(source, key, buffer):
+        """Whether buffer still holds what was computed for key (the workspace may have replaced it)."""
+        return key is not None and source[0] == key and source[1] is buffer
+
+    def mix_spectra(self, spectra, weights, components, region_type=None, region_size_percentage=50,
+                    image_shape=None, stamps=None):
+        """Same contract as mix_spectra in Mag/Phase mode; the returned spectrum must not be modified.
+
+        It stays valid until the next call. Without stamps (see SpectrumStack)
+        nothing is reused between calls.
+        """
+        if len(spectra) == 0 or spectra[0].ndim != 2:
+            return None
+        components = np.asarray(components)
+        magnitude_rows = np.flatnonzero(components == "Magnitude")
+        phase_rows = np.flatnonzero(components == "Phase")
+        if not (len(magnitude_rows) or len(phase_rows)):
+            return None
+
+        dtype = _spectra_dtype(spectra)
+        real_dtype = np.finfo(dtype).dtype
+        shape = spectra[0].shape
+        if len(magnitude_rows):
+            # Weighted average of the selected magnitudes
+            magnitude_weights = [float(weights[i]) / len(magnitude_rows) for i in magnitude_rows]
+        else:
+            # Without a magnitude source, borrow the first input's magnitude
+            magnitude_rows, magnitude_weights = [0], [1.0]
+        phase_weights = [float(weights[i]) / len(phase_rows) for i in phase_rows]
+
+        def key(rows, row_weights):
+            if stamps is None:
+                return None
+            return shape, dtype, tuple(int(stamps[i]) for i in rows), tuple(row_weights)
+
+        band_rows = min(shape[0], max(1, MIX_BAND_BYTES // (shape[1] * real_dtype.itemsize)))
+        bands = [slice(start, start + band_rows) for start in range(0, shape[0], band_rows)]
+
+        with instrumentation.span("mix"):
+            scratch = self._buffer("scratch", (band_rows, shape[1]), real_dtype)
+            magnitude = self._buffer("magnitude", shape, real_dtype)
+            magnitude_key = key(magnitude_rows, magnitude_weights)
+            if not self._holds(self._magnitude_source, magnitude_key, magnitude):
+                self._magnitude_source = (None, None)
+                for band in bands:
+                    magnitude_band = magnitude[band]
+                    band_scratch = scratch[:len(magnitude_band)]
+                    magnitude_band[...] = 0
+                    for i, weight in zip(magnitude_rows, magnitude_weights):
+                        if weight:
+                            np.abs(spectra[i][band], out=band_scratch)
+                            band_scratch *= weight
+                            magnitude_band += band_scratch
+                self._magnitude_source = (magnitude_key, magnitude)
+
+            mixed_ft = self._buffer("mixed", shape, dtype)
+            if len(phase_rows):
+                phasor = self._buffer("phasor", shape, dtype)
+                phasor_key = key(phase_rows, phase_weights)
+                if not self._holds(self._phasor_source, phasor_key, phasor):
+                    self._phasor_source = (None, None)
+                    for band in bands:
+                        self._unit_phasor(spectra, phase_rows, phase_weights, band, phasor[band], scratch)
+                    self._phasor_source = (phasor_key, phasor)
+                np.multiply(phasor, magnitude, out=mixed_ft)
+            else:
+                mixed_ft.real = magnitude
+                mixed_ft.imag = 0
+
+        # The region is shared by all inputs, so apply it once to the combined spectrum
+        apply_region(mixed_ft, region_size_percentage, region_type, image_shape)
+        mixed_ft = mixed_ft.view()
+        mixed_ft.setflags(write=False)
+        return mixed_ft
+
+    def _unit_phasor(self, spectra, rows, row_weights, band, phasor, scratch):
+        """Write exp(j * sum of weighted phases) of the rows in band into phasor, that band of the phasor.
+
+        scratch is the band-sized scratch buffer; the last band may use only its first rows.
+        """
+        if len(rows) == 1 and row_weights[0] == 1.0:
+            # exp(j * angle(F)) is F / |F|, and 1 where F is 0 (whose angle is 0)
+            spectrum = spectra[rows[0]][band]
+            scratch = scratch[:len(phasor)]
+            np.abs(spectrum, out=scratch)
+            phasor[...] = 1
+            np.divide(spectrum, scratch, out=phasor, where=scratch != 0)
+            return
+
+        phase = self._buffer("phase", scratch.shape, scratch.dtype)[:len(phasor)]
+        scratch = scratch[:len(phasor)]
+        phase[...] = 0
+        for i, weight in zip(rows, row_weights):
+            if weight:
+                spectrum = spectra[i][band]
+                np.arctan2(spectrum.imag, spectrum.real, out=scratch)
+                scratch *= weight
+                phase += scratch
+        np.cos(phase, out=phasor.real)
+        np.sin(phase, out=phasor.imag)
+
+
+class IncrementalMixer:
+    """Mixer that keeps the last Real/Imag accumulation and updates it in place.
+
+    Real/Imag mixing is linear in the weights. When the spectra, component
+    selections and mode are unchanged and at most one weight moved, the
+    accumulated spectrum is corrected by (new - old weight) * component
+    instead of being rebuilt from every input. The accumulation is kept before
+    the region is applied, so region changes reuse it too. Anything else
+    goes through mix_spectra. Mag/Phase mode, which is not linear, goes
+    through a MagPhaseMixer. The accumulation, and its copy when a region is
+    applied, live in "mix.*" buffers of a Workspace.
+    """
+
+    # Rebuild from scratch after this many in-place updates to bound rounding drift
+    REBUILD_EVERY = 64
+
+    def __init__(self, workspace=None):
+        self.workspace = workspace if workspace is not None else Workspace()
+        self.mag_phase_mixer = MagPhaseMixer(self.workspace)
+        self.reset()
+
+    def reset(self):
+        """Forget the cached accumulation and Mag/Phase buffers."""
+        self.mag_phase_mixer.reset()
+        self._forget_accumulation()
+
+    def _forget_accumulation(self):
+        self._spectra = None
+        self._stamps = None
+        self._key = None
+        self._weights = None
+        self._accumulated = None
+        self._updates = 0
+
+    def mix_spectra(self, spectra, weights, components, mode, region_type=None, region_size_percentage=50,
+                    image_shape=None, stamps=None):
+        """Same contract as mix_spectra; the returned spectrum must not be modified.
+
+        stamps optionally identifies the content of each spectrum (see
+        SpectrumStack); without them, inputs are matched by object identity.
+        """
+        weights = [float(weight) for weight in weights]
+        components = list(components)
+
+        if mode == MAG_PHASE:
+            self._forget_accumulation()
+            return self.mag_phase_mixer.mix_spectra(spectra, weights, components, region_type,
+                                                    region_size_percentage, image_shape, stamps)
+        if mode != REAL_IMAG:
+            raise ValueError(f"Unknown mixing mode: {mode}")
+
+        if len(spectra) == 0 or spectra[0].ndim != 2:
+            self._forget_accumulation()
+            return None
+
+        key = (tuple(components), image_shape)
+        same_inputs = (
+            self._accumulated is not None
+            and key == self._key
+            and len(spectra) == len(self._spectra)
+            and (tuple(stamps) == self._stamps if stamps is not None
+                 else all(new is old for new, old in zip(spectra, self._spectra)))
+        )
+        changed = [i for i, (new, old) in enumerate(zip(weights, self._weights or [])) if new != old]
+
+        if same_inputs and len(changed) <= 1 and self._updates < self.REBUILD_EVERY:
+            for i in changed:
+                delta = weights[i] - self._weights[i]
+                if components[i] == "Real":
+                    self._accumulated.real += delta * spectra[i].real
+                elif components[i] == "Imaginary":
+                    self._accumulated.imag += delta * spectra[i].imag
+            self._updates += len(changed)
+        else:
+            accumulated = self.workspace.buffer("mix.accumulated", spectra[0].shape, _spectra_dtype(spectra))
+            self._accumulated = mix_spectra(spectra, weights, components, mode, image_shape=image_shape,
+                                            out=accumulated)
+            self._updates = 0
+            if self._accumulated is None:
+                self._forget_accumulation()
+                return None
+
+        self._spectra = list(spectra)
+        self._stamps = tuple(stamps) if stamps is not None else None
+        self._key = key
+        self._weights = weights
+
+        if region_type in ("inner", "outer"):
+            regioned = self.workspace.buffer("mix.region", self._accumulated.shape, self._accumulated.dtype)
+            np.copyto(regioned, self._accumulated)
+            return apply_region(regioned, region_size_percentage, region_type, image_shape)
+
+        # Whole FT: hand out a read-only view of the accumulation itself
+        mixed_ft = self._accumulated.view()
+        mixed_ft.setflags(write=False)
+        return mixed_ft
+
+
+class BasisMixer:
+    """Real/Imag mixer that needs no FFT once its basis images are cached.
+
+    Real/Imag mixing, the region and the inverse transform are all linear,
+    so the mixed image is sum_i w_i * B_i, where the basis image B_i is the
+    inverse transform of input i's selected part (its real part, or j times
+    its imaginary part) after the region. Bases are keyed by the input's
+    SpectrumStack stamp, its component, the region rectangle and the layout,
+    so new weights only cost a weighted sum; a new selection or region needs
+    new bases, computed one at a time with add_basis().
+
+    Bases are float32 whatever the spectrum precision, since the mix is
+    rounded to uint8 anyway. They are only kept for mixes whose bases fit in
+    max_bytes.
+    """
+
+    def __init__(self, max_bytes=BASIS_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._bases = {}
+
+    @classmethod
+    def from_environment(cls):
+        """Build a mixer whose budget is IMAGE_EQUALIZER_BASIS_MB (BASIS_MAX_BYTES if unset)."""
+        size_mb = os.environ.get(BASIS_BUDGET_ENV)
+        return cls(max(0, int(float(size_mb) * 2**20)) if size_mb else BASIS_MAX_BYTES)
+
+    def reset(self):
+        """Forget every basis image."""
+        self._bases.clear()
+
+    def plan(self, spectra, components, region_type, region_size_percentage, image_shape, stamps):
+        """Return [(input index, basis key)] for the inputs that contribute to a Real/Imag mix."""
+        if region_type in ("inner", "outer"):
+            row_slice, col_slice = region_bounds(spectra[0].shape, region_size_percentage, image_shape)
+            region = (region_type, row_slice.start, row_slice.stop, col_slice.start, col_slice.stop)
+        else:
+            region = None
+        return [(i, (int(stamps[i]), component, region, image_shape))
+                for i, component in enumerate(components) if component in ("Real", "Imaginary")]
+
+    def fits(self, spectra, plan, image_shape):
+        """Whether the bases of plan stay within max_bytes."""
+        rows, cols = image_shape if image_shape is not None else spectra[0].shape
+        return len(plan) * rows * cols * np.dtype(np.float32).itemsize <= self.max_bytes
+
+    def missing(self, plan):
+        """The (input index, basis key) pairs of plan that have no basis yet."""
+        return [(i, key) for i, key in plan if key not in self._bases]
+
+    def retain(self, plan):
+        """Drop every basis that plan does not use."""
+        keep = {key for _, key in plan}
+        for key in list(self._bases):
+            if key not in keep:
+                del self._bases[key]
+
+    def add_basis(self, spectrum, key, region_size_percentage):
+        """Compute and cache the basis image of spectrum for key."""
+        _, component, region, image_shape = key
+        part = np.zeros_like(spectrum)
+        if component == "Real":
+            part.real = spectrum.real
+        else:
+            part.imag = spectrum.imag  # j times the imaginary part
+        if region is not None:
+            apply_region(part, region_size_percentage, region[0], image_shape)
+        self._bases[key] = inverse(part, image_shape).astype(np.float32, copy=False)
+
+    def mix(self, weights, plan):
+        """Weighted sum of the bases of plan as a uint8 image, or None if no input contributes."""
+        if not plan:
+            return None
+        with instrumentation.span("basis_sum"):
+            mixed_image = None
+            for i, key in plan:
+                basis = self._bases[key]
+                if mixed_image is None:
+                    mixed_image = basis * basis.dtype.type(weights[i])
+                elif weights[i]:
+                    mixed_image += basis * basis.dtype.type(weights[i])
+            return to_uint8(mixed_image)
@@ -0,0 +1,256 @@
+import threading
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import instrumentation
+import mixer
+import region_sweep
+from workspace import Workspace
+
+
+class MixingCanceled(Exception):
+    """Raised inside the worker when a newer mixing request supersedes the current one."""
+
+
+class MixingWorker(QThread):
+    """Run mixing requests off the GUI thread.
+
+    Every request gets a generation number. Requests that arrive while a mix
+    is running are coalesced: only the most recent one is kept, and the mix in
+    progress is abandoned at its next stage boundary. Results and progress are
+    tagged with their generation so the GUI can drop anything stale.
+
+    While idle after a full mix, the worker first computes the Real/Imag
+    basis images of the current selection (so later weight changes need no
+    FFT), then precomputes the output of every inner and outer region size
+    for the same settings into sweep_cache, nearest to the current size first
+    and only as many as the cache holds, so the GUI can show them while
+    the region slider is scrubbed. Idle work runs one step at a time, and new
+    requests always run before the next step.
+
+    Intermediate spectra and images go into the "mix.*" buffers of workspace;
+    the images handed to the GUI are always fresh arrays.
+    """
+
+    progress = pyqtSignal(int, int)          # generation, percentage
+    result_ready = pyqtSignal(int, object, object)  # generation, mixed image, job
+
+    def __init__(self, parent=None, workspace=None):
+        super().__init__(parent)
+        self.workspace = workspace if workspace is not None else Workspace()
+        self.generation = 0
+        self._pending = None
+        self._stopping = False
+        self._idle = True  # Waiting for requests, with no idle work left
+        self._forget = False  # Reset the mixers before the next request
+        self._condition = threading.Condition()
+        self.incremental_mixer = mixer.IncrementalMixer(self.workspace)  # Only used from the worker thread
+        self.basis_mixer = mixer.BasisMixer.from_environment()  # Only used from the worker thread
+        self._basis = None  # Basis images still to compute, only used from the worker thread
+        self.sweep_regions = True  # Precompute region outputs while idle
+        self.sweep_cache = region_sweep.RegionSweepCache()
+        self._sweep = None  # Region sweep in progress, only used from the worker thread
+
+    def submit(self, job):
+        """Queue a mixing job (a dict of mixer.mix arguments) and return its generation."""
+        with self._condition:
+            self.generation += 1
+            self._pending = (self.generation, job)
+            self._idle = False
+            self._condition.notify()
+        if not self.isRunning():
+            self.start()
+        return self.generation
+
+    def stop(self):
+        """Ask the worker loop to exit and wait for it."""
+        with self._condition:
+            self._stopping = True
+            self._pending = None
+            self._condition.notify()
+        self.wait()
+
+    def supersede(self):
+        """Drop the queued request and any running one (their results become stale); returns the new generation."""
+        with self._condition:
+            self.generation += 1
+            self._pending = None
+        return self.generation
+
+    def is_idle(self):
+        """Return True once every request has been mixed and no basis images or region sweep are left to do."""
+        with self._condition:
+            return self._idle
+
+    def forget_caches(self):
+        """Make the next request mix from the spectra, without the accumulations and bases kept so far."""
+        with self._condition:
+            self._forget = True
+
+    def is_current(self, generation):
+        """Return True if no newer request has been submitted since generation."""
+        return generation == self.generation
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and self._basis is None and self._sweep is None and not self._stopping:
+                    self._idle = True
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                pending, self._pending = self._pending, None
+                forget = self._forget and pending is not None
+                if forget:
+                    self._forget = False
+
+            if forget:
+                self.incremental_mixer.reset()
+                self.basis_mixer.reset()
+                self._basis = None
+
+            if pending is None:
+                # Idle: one more basis image, or one more region size of the settled mix
+                if self._basis is not None:
+                    self._basis_step()
+                else:
+                    self._sweep_step()
+                continue
+
+            generation, job = pending
+            try:
+                mixed_image = self._mix(generation, job)
+            except MixingCanceled:
+                continue
+            except Exception as e:
+                print(f"Mixing failed: {e}")
+                self.incremental_mixer.reset()
+                self.basis_mixer.reset()
+                continue
+            self.result_ready.emit(generation, mixed_image, job)
+            if "preview_shape" not in job and mixed_image is not None:
+                self._start_basis(job)
+                self._start_sweep(job)
+
+    def _stage(self, generation, value):
+        """Report progress, bailing out if the request has been superseded."""
+        if not self.is_current(generation) or self._stopping:
+            raise MixingCanceled()
+        self.progress.emit(generation, value)
+
+    def _mix(self, generation, job):
+        plan = self._basis_plan(job)
+        if plan and not self.basis_mixer.missing(plan):
+            # Every basis image is cached: the full mix is a weighted sum without any FFT,
+            # cheaper than even a preview
+            self._stage(generation, 50)
+            mixed_image = self.basis_mixer.mix(job["weights"], plan)
+            self._stage(generation, 100)
+            return mixed_image
+
+        if "preview_shape" in job:
+            # Previews are cheap enough to run in one go
+            self._stage(generation, 0)
+            return mixer.preview(
+                job["spectra"], job["weights"], job["components"], job["mode"],
+                job["region_type"], job["region_size_percentage"], job["image_shape"],
+                job["preview_shape"],
+            )
+
+        self._stage(generation, 10)
+        mixed_ft = self.incremental_mixer.mix_spectra(
+            job["spectra"], job["weights"], job["components"], job["mode"],
+            job["region_type"], job["region_size_percentage"], job["image_shape"], job.get("stamps"),
+        )
+        if mixed_ft is None:
+            return None
+
+        self._stage(generation, 50)
+        mixed_image = mixer.reconstruct(mixed_ft, job["image_shape"], self.workspace)
+
+        self._stage(generation, 100)
+        return mixed_image
+
+    def _basis_plan(self, job):
+        """The basis images a job needs, or None if it is not a Real/Imag mix of stacked spectra."""
+        if job["mode"] != mixer.REAL_IMAG or job.get("stamps") is None:
+            return None
+        return self.basis_mixer.plan(job["spectra"], job["components"], job["region_type"],
+                                     job["region_size_percentage"], job["image_shape"], job["stamps"])
+
+    def _start_basis(self, job):
+        """Plan the basis images of a settled Real/Imag job, dropping those of older selections."""
+        plan = self._basis_plan(job)
+        if not plan or not self.basis_mixer.fits(job["spectra"], plan, job["image_shape"]):
+            self._basis = None
+            return
+        self.basis_mixer.retain(plan)
+        self._basis = {"job": job, "plan": plan}
+
+    def _basis_step(self):
+        """Compute the next missing basis image."""
+        job, missing = self._basis["job"], self.basis_mixer.missing(self._basis["plan"])
+        if not missing:
+            self._basis = None
+            return
+        i, key = missing[0]
+        try:
+            with instrumentation.span("basis_image"):
+                self.basis_mixer.add_basis(job["spectra"][i], key, job["region_size_percentage"])
+        except Exception as e:
+            print(f"Basis image failed: {e}")
+            self._basis = None
+
+    def _start_sweep(self, job):
+        """Plan a region sweep for a settled job, unless one for the same settings is under way."""
+        key = region_sweep.sweep_key(job)
+        if not self.sweep_regions or key is None or (self._sweep is not None and self._sweep["key"] == key):
+            return
+        self._sweep = {
+            "key": key,
+            "job": job,
+            "sizes": region_sweep.sweep_order(job["region_size_percentage"]),
+            "done": set(),
+            "mixed_ft": None,
+        }
+
+    def _sweep_step(self):
+        """Compute the inner and outer outputs of the next region size of the sweep."""
+        sweep, job = self._sweep, self._sweep["job"]
+        image_shape = job["image_shape"]
+        try:
+            if sweep["mixed_ft"] is None:
+                # The mix without any region, and its inverse (the sum of every inner and outer pair)
+                sweep["mixed_ft"] = mixer.mix_spectra(job["spectra"], job["weights"], job["components"],
+                                                      job["mode"], image_shape=image_shape)
+                sweep["whole"] = mixer.inverse(sweep["mixed_ft"], image_shape, self.workspace)
+                return
+
+            # Sizes are swept nearest first, so stop once the cache is full of this sweep's
+            # outputs: any further size would evict one nearer to the slider
+            if len(sweep["done"]) >= self.sweep_cache.capacity(2 * sweep["whole"].size):
+                self._sweep = None
+                return
+
+            while sweep["sizes"]:
+                size = sweep["sizes"].pop(0)
+                bounds = region_sweep.bounds_key(sweep["mixed_ft"].shape, size, image_shape)
+                if bounds not in sweep["done"]:
+                    break
+            else:
+                self._sweep = None
+                return
+            sweep["done"].add(bounds)
+
+            with instrumentation.span("region_sweep"):
+                # The outer region is the complement of the inner one, and the transform is linear
+                inner_ft = self.workspace.buffer("mix.region", sweep["mixed_ft"].shape, sweep["mixed_ft"].dtype)
+                np.copyto(inner_ft, sweep["mixed_ft"])
+                mixer.apply_region(inner_ft, size, "inner", image_shape)
+                inner = mixer.inverse(inner_ft, image_shape, self.workspace)
+                self.sweep_cache.put(sweep["key"], "inner", bounds, mixer.to_uint8(inner))
+                self.sweep_cache.put(sweep["key"], "outer", bounds, mixer.to_uint8(sweep["whole"] - inner))
+        except Exception as e:
+            print(f"Region sweep failed: {e}")
+            self._sweep = None
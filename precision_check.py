@@ -0,0 +1,87 @@
+"""Compare single-precision mixing against double precision on a set of images.
+
+Usage: python precision_check.py [image_dir] [--tolerance GRAY_LEVELS]
+
+Every image in the directory is mixed with the next one in every mode,
+region and spectrum layout, once in complex128 and once in complex64. The
+largest per-pixel difference of the uint8 outputs is reported, and the script
+exits with status 1 if it exceeds the tolerance.
+"""
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+import mixer
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.bmp", "*.gif")
+
+CASES = [
+    (mixer.MAG_PHASE, ["Magnitude", "Phase"]),
+    (mixer.MAG_PHASE, ["Phase", "Magnitude"]),
+    (mixer.REAL_IMAG, ["Real", "Imaginary"]),
+    (mixer.REAL_IMAG, ["Imaginary", "Real"]),
+]
+REGIONS = [(None, 50), ("inner", 30), ("outer", 30)]
+
+
+def load_images(image_dir):
+    """Load every image in image_dir as grayscale, resized to the smallest common size."""
+    paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(image_dir, pattern)))
+    images = [Image.open(path).convert("L") for path in paths]
+    if not images:
+        return paths, []
+    width = min(image.size[0] for image in images)
+    height = min(image.size[1] for image in images)
+    return paths, [np.array(image.resize((width, height), Image.Resampling.LANCZOS)) for image in images]
+
+
+def compare(first, second, weights=(0.7, 0.4)):
+    """Return the largest uint8 difference between double and single-precision mixes of two images."""
+    worst = 0
+    for half_spectrum in (False, True):
+        image_shape = first.shape if half_spectrum else None
+        double = np.stack([mixer.forward(image, half_spectrum) for image in (first, second)])
+        single = np.stack([mixer.forward(image, half_spectrum, single_precision=True) for image in (first, second)])
+
+        for mode, components in CASES:
+            for region_type, region_size_percentage in REGIONS:
+                args = (weights, components, mode, region_type, region_size_percentage, image_shape)
+                expected = mixer.mix(double, *args).astype(np.int16)
+                actual = mixer.mix(single, *args).astype(np.int16)
+                worst = max(worst, int(np.abs(expected - actual).max()))
+    return worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image_dir", nargs="?", default=os.path.join(os.path.dirname(__file__), "images"))
+    parser.add_argument("--tolerance", type=int, default=1, help="largest allowed difference in gray levels")
+    args = parser.parse_args(argv)
+
+    paths, images = load_images(args.image_dir)
+    if len(images) < 2:
+        print(f"Need at least two images in {args.image_dir}.")
+        return 1
+
+    worst = 0
+    for i, image in enumerate(images):
+        other = images[(i + 1) % len(images)]
+        difference = compare(image, other)
+        worst = max(worst, difference)
+        print(f"{os.path.basename(paths[i])}: max difference {difference} gray level(s)")
+
+    print(f"Spectrum memory per image: {mixer.forward(images[0]).nbytes / 2**20:.1f} MB (double), "
+          f"{mixer.forward(images[0], single_precision=True).nbytes / 2**20:.1f} MB (single)")
+    if worst > args.tolerance:
+        print(f"FAILED: single precision differs by up to {worst} gray levels (tolerance {args.tolerance}).")
+        return 1
+    print(f"OK: single precision is within {args.tolerance} gray level(s) of double precision.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+import threading
+
+import mixer
+
+# Upper bound on the precomputed region outputs kept in memory
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Region sizes the slider can select
+REGION_SIZES = range(0, 101)
+
+
+def sweep_key(job):
+    """Identify the region-independent part of a mixing job, or None if it cannot be swept.
+
+    Only jobs built from a SpectrumStack carry the stamps that identify
+    their spectra's content.
+    """
+    if job.get("stamps") is None:
+        return None
+    return (
+        tuple(int(stamp) for stamp in job["stamps"]),
+        tuple(float(weight) for weight in job["weights"]),
+        tuple(job["components"]),
+        job["mode"],
+        job["image_shape"],
+    )
+
+
+def bounds_key(spectrum_shape, region_size_percentage, image_shape=None):
+    """The region rectangle a size selects; sizes that select the same rectangle share an output."""
+    row_slice, col_slice = mixer.region_bounds(spectrum_shape, region_size_percentage, image_shape)
+    return row_slice.start, row_slice.stop, col_slice.start, col_slice.stop
+
+
+def sweep_order(region_size_percentage):
+    """All region sizes, nearest to the current one first."""
+    return sorted(REGION_SIZES, key=lambda size: abs(size - region_size_percentage))
+
+
+class RegionSweepCache:
+    """Bounded LRU cache of mixed outputs by (sweep key, region type, region bounds).
+
+    Filled by the mixing worker, read by the GUI thread.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def capacity(self, nbytes):
+        """How many outputs of nbytes fit in max_bytes."""
+        return self.max_bytes // max(1, nbytes)
+
+    def get(self, key, region_type, bounds):
+        """Return the cached output image, or None."""
+        with self._lock:
+            image = self._entries.get((key, region_type, bounds))
+            if image is not None:
+                self._entries.move_to_end((key, region_type, bounds))
+            return image
+
+    def put(self, key, region_type, bounds, image):
+        """Remember an output image, evicting the least recently used ones beyond max_bytes."""
+        with self._lock:
+            old = self._entries.pop((key, region_type, bounds), None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[(key, region_type, bounds)] = image
+            self.nbytes += image.nbytes
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
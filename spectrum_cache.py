@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+import fft_backend
+
+# Environment variables read by SpectrumCache.from_environment()
+CACHE_DIR_ENV = "IMAGE_EQUALIZER_CACHE_DIR"  # The cache is only used when this is set
+CACHE_SIZE_ENV = "IMAGE_EQUALIZER_CACHE_MB"  # 0 disables the cache
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+SESSION_FILE = "session.json"
+
+
+class SpectrumCache:
+    """Content-addressed on-disk cache of resized images, spectra and components.
+
+    An entry is keyed by the source image's content hash, the target size,
+    the spectrum layout and precision and the FFT backend. Each array is a
+    .npy file named after that key; spectra and components are memory-mapped
+    back in, so a hit reads only the pages that are used. The least recently
+    used entries are deleted once the files exceed max_bytes. The cache
+    directory also keeps the last session (see save_session).
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls):
+        """Build the cache from IMAGE_EQUALIZER_CACHE_DIR and IMAGE_EQUALIZER_CACHE_MB, or None if disabled.
+
+        The cache is opt-in: without IMAGE_EQUALIZER_CACHE_DIR nothing is written to disk.
+        """
+        directory = os.environ.get(CACHE_DIR_ENV)
+        size_mb = os.environ.get(CACHE_SIZE_ENV)
+        max_bytes = int(float(size_mb) * 2**20) if size_mb else DEFAULT_MAX_BYTES
+        if not directory or max_bytes <= 0:
+            return None
+        try:
+            return cls(directory, max_bytes)
+        except OSError as e:
+            print(f"Spectrum cache disabled: {e}")
+            return None
+
+    def entry_name(self, image_hash, target_size, half_spectrum, single_precision):
+        """File name prefix of the entry for an image prepared with these settings."""
+        key = (image_hash, tuple(target_size), bool(half_spectrum),
+               "complex64" if single_precision else "complex128", fft_backend.active_backend())
+        return hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+    def _path(self, name, part):
+        return os.path.join(self.directory, f"{name}.{part}.npy")
+
+    def load(self, name):
+        """Return a cached entry as a prepare_input() result, or None on a miss."""
+        spectrum_path = self._path(name, "spectrum")
+        try:
+            ft_image = np.load(spectrum_path, mmap_mode="r")
+            image = Image.fromarray(np.load(self._path(name, "image")))
+            components = {}
+            magnitude_path = self._path(name, "Magnitude")
+            if os.path.exists(magnitude_path):
+                components["Magnitude"] = np.load(magnitude_path, mmap_mode="r")
+            os.utime(spectrum_path)  # Most recently used
+        except (OSError, ValueError):
+            return None
+        return {"image": image, "ft_image": ft_image, "components": components}
+
+    def store(self, name, result):
+        """Write a prepare_input() result to the cache, then evict down to max_bytes."""
+        parts = {"image": np.asarray(result["image"]), "spectrum": result["ft_image"]}
+        for component, value in result.get("components", {}).items():
+            parts[component] = value
+        try:
+            # The spectrum goes last: an entry only counts once its spectrum exists. Writes hold
+            # the lock, so evict() never mistakes an entry being written for an unused one.
+            with self._lock:
+                for part in sorted(parts, key=lambda part: part == "spectrum"):
+                    fd, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                    with os.fdopen(fd, "wb") as output:
+                        np.save(output, parts[part])
+                    os.replace(temporary_path, self._path(name, part))
+        except OSError as e:
+            print(f"Could not cache spectrum: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = {}  # name -> [bytes, last use]
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".npy"):
+                    continue
+                name, part, _ = entry.name.split(".", 2)
+                stat = entry.stat()
+                sizes = entries.setdefault(name, [0, 0.0])
+                sizes[0] += stat.st_size
+                if part == "spectrum":
+                    sizes[1] = stat.st_mtime
+
+            total = sum(size for size, _ in entries.values())
+            for name, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                for filename in os.listdir(self.directory):
+                    if filename.startswith(name + "."):
+                        try:
+                            os.remove(os.path.join(self.directory, filename))
+                        except OSError:
+                            pass
+                total -= size
+
+    def save_session(self, session):
+        """Remember a session (a JSON-serializable dict) for load_session."""
+        path = os.path.join(self.directory, SESSION_FILE)
+        try:
+            with open(path + ".tmp", "w") as output:
+                json.dump(session, output, indent=2)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Could not save the session: {e}")
+
+    def load_session(self):
+        """Return the last saved session, or None."""
+        try:
+            with open(os.path.join(self.directory, SESSION_FILE)) as session_file:
+                return json.load(session_file)
+        except (OSError, ValueError):
+            return None
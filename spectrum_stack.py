@@ -0,0 +1,66 @@
+import numpy as np
+
+
+class SpectrumStack:
+    """Spectra of all inputs in one contiguous (N, H, W) array, with weight and selection vectors.
+
+    Row i holds the spectrum of input i; loaded[i] says whether it is current,
+    weights[i] is its slider weight in [0, 1] and components[i] its selected
+    FT component. All loaded rows share one spectrum shape and dtype: setting
+    a spectrum of another shape or dtype (after a size or precision change)
+    reallocates the array and marks the other rows as not loaded until they
+    are set again. Every set() gives the row a new stamp, so callers can tell
+    a reloaded row from an unchanged one.
+    """
+
+    def __init__(self, count, allocator=np.empty):
+        self.count = count
+        self.allocator = allocator
+        self._next_stamp = 0  # Never reset, so stamps stay unique across clear()
+        self.clear()
+
+    def clear(self):
+        """Drop every spectrum and reset the weights and selections."""
+        self.spectra = None  # (count, H, W) complex array
+        self.image_shape = None  # Spatial (height, width) behind the loaded spectra
+        self.loaded = np.zeros(self.count, dtype=bool)
+        self.weights = np.zeros(self.count)
+        self.components = np.full(self.count, "Magnitude", dtype=object)
+        self.stamps = np.zeros(self.count, dtype=np.int64)
+        self._rows = [None] * self.count
+
+    def set(self, index, spectrum, image_shape):
+        """Copy spectrum into row index and return the row (a view into the stack)."""
+        if spectrum is None:
+            self.loaded[index] = False
+            self._rows[index] = None
+            return None
+
+        if (self.spectra is None or self.spectra.shape[1:] != spectrum.shape
+                or self.spectra.dtype != spectrum.dtype or self.image_shape != tuple(image_shape)):
+            self.spectra = self.allocator((self.count,) + spectrum.shape, spectrum.dtype)
+            self.image_shape = tuple(image_shape)
+            self.loaded[:] = False
+            self._rows = [None] * self.count
+
+        self.spectra[index] = spectrum
+        self.loaded[index] = True
+        self._next_stamp += 1
+        self.stamps[index] = self._next_stamp
+        self._rows[index] = self.spectra[index]
+        return self._rows[index]
+
+    def get(self, index):
+        """Return the spectrum of input index, or None if it is not loaded."""
+        return self._rows[index] if self.loaded[index] else None
+
+    def loaded_indices(self):
+        """Indices of the loaded inputs, in order."""
+        return np.flatnonzero(self.loaded)
+
+    def rows(self, indices):
+        """The spectra of the given inputs, as a view of the stack when they are consecutive."""
+        indices = np.asarray(indices)
+        if len(indices) and np.array_equal(indices, np.arange(indices[0], indices[0] + len(indices))):
+            return self.spectra[indices[0]:indices[0] + len(indices)]
+        return [self._rows[i] for i in indices]
@@ -0,0 +1,97 @@
+import numpy as np
+
+import instrumentation
+from component_store import block_reduce
+from mixer import expand_half
+
+MAX_ZOOM = 64.0
+
+
+def tone_map(values, component, workspace=None):
+    """Map component values to uint8 for display, or return None if they have no variation.
+
+    With a workspace, the scaled values and the result go into its "display.*"
+    buffers, so the result is only valid until the next call.
+    """
+    with instrumentation.span("normalization"):
+        if workspace is None:
+            scaled = np.empty(values.shape, np.result_type(values.dtype, np.float32))
+            result = np.empty(values.shape, np.uint8)
+        else:
+            scaled = workspace.buffer("display.tone", values.shape, np.result_type(values.dtype, np.float32))
+            result = workspace.buffer("display.tone_uint8", values.shape, np.uint8)
+
+        # Apply log scale for better visibility (except for Phase, as it doesn't need scaling)
+        if component != "Phase":
+            np.abs(values, out=scaled)
+            np.log1p(scaled, out=scaled)  # Add 1 to avoid log(0)
+        else:
+            np.copyto(scaled, values)
+
+        values_min = scaled.min()
+        values_max = scaled.max()
+        if values_max == values_min:
+            return None
+
+        # Normalize to 0-255 for display
+        scaled -= values_min
+        scaled *= 255 / (values_max - values_min)
+        np.copyto(result, scaled, casting="unsafe")
+        return result
+
+
+def render_component(store, index, component, target_size, zoom=1.0, image_width=None, workspace=None):
+    """Render an FT component at (at most) the viewer's resolution.
+
+    The component is reduced before tone-mapping: the coarsest pyramid level
+    that still covers target_size (width, height) is picked for the zoomed
+    window, then block-averaged down to the viewer. Zooming in therefore pulls
+    finer levels on demand. Pass image_width when the store holds half
+    spectra; the reduced half plane is mirrored out to the full plane.
+    Returns a uint8 array (in workspace, if given; see tone_map), or None if
+    there is nothing to show.
+    """
+    spectrum = store.spectrum(index)
+    if spectrum is None:
+        return None
+
+    half = image_width is not None
+    target_width, target_height = target_size
+    if half:
+        target_width = max(1, target_width // 2)
+    zoom = max(1.0, min(MAX_ZOOM, zoom))
+
+    # Size of the zoomed window at full resolution
+    rows, cols = spectrum.shape
+    window_rows = max(1, int(rows / zoom))
+    window_cols = max(1, int(cols / zoom))
+
+    # Coarsest level that still has at least the viewer's resolution
+    level = 0
+    while (window_rows >> (level + 1) >= target_height
+           and window_cols >> (level + 1) >= target_width):
+        level += 1
+
+    data = store.level(index, component, level)
+    if data is None:
+        return None
+
+    # Crop the window around DC (half planes start at the DC column)
+    window_rows = max(1, window_rows >> level)
+    window_cols = max(1, window_cols >> level)
+    top = max(0, data.shape[0] // 2 - window_rows // 2)
+    left = 0 if half else max(0, data.shape[1] // 2 - window_cols // 2)
+    window = data[top:top + window_rows, left:left + window_cols]
+
+    reduced = block_reduce(window,
+                           max(1, window.shape[0] // target_height),
+                           max(1, window.shape[1] // target_width))
+
+    if half:
+        # The full plane whose half plane (non-negative columns) this is; at native
+        # resolution that is the image width itself
+        columns = reduced.shape[1]
+        width = max(1, 2 * columns - 1 if image_width % 2 else 2 * (columns - 1))
+        reduced = expand_half(reduced, width, component)
+
+    return tone_map(reduced, component, workspace)
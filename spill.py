@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+import instrumentation
+
+# Environment variables read by SpillManager.from_environment()
+RAM_CEILING_ENV = "IMAGE_EQUALIZER_RAM_CEILING_MB"  # Unset or 0: never spill
+SCRATCH_DIR_ENV = "IMAGE_EQUALIZER_SCRATCH_DIR"     # Defaults to the system temp directory
+
+
+class SpillManager:
+    """Keep large arrays in RAM up to a ceiling, and in memory-mapped scratch files beyond it.
+
+    Spectra and derived components go through empty() or adopt(). While the
+    arrays handed out so far stay under ram_ceiling bytes they are ordinary
+    arrays; after that they are np.memmap files in scratch_dir, so the OS only
+    pages in the parts that are actually read. The files are unlinked right
+    away and disappear when their arrays are garbage collected.
+    """
+
+    def __init__(self, ram_ceiling=None, scratch_dir=None):
+        self.ram_ceiling = ram_ceiling
+        self.scratch_dir = scratch_dir
+        self.resident_bytes = 0
+        self.spilled_bytes = 0
+        self._tracked = {}  # id(array) -> (nbytes, spilled)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        """Build a manager configured from IMAGE_EQUALIZER_RAM_CEILING_MB and IMAGE_EQUALIZER_SCRATCH_DIR."""
+        ceiling_mb = float(os.environ.get(RAM_CEILING_ENV) or 0)
+        return cls(int(ceiling_mb * 2**20) if ceiling_mb > 0 else None, os.environ.get(SCRATCH_DIR_ENV))
+
+    def empty(self, shape, dtype):
+        """Return an uninitialized array, memory-mapped if it would push RAM use over the ceiling."""
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if self._should_spill(nbytes):
+            array = self._memmap(shape, dtype)
+        else:
+            array = np.empty(shape, dtype)
+        self._track(array, nbytes, isinstance(array, np.memmap))
+        return array
+
+    def adopt(self, array):
+        """Account for an array, moving it into a scratch file if it would exceed the ceiling."""
+        if array is None or id(array) in self._tracked:
+            return array
+        if not isinstance(array, np.memmap) and self._should_spill(array.nbytes):
+            spilled = self._memmap(array.shape, array.dtype)
+            spilled[...] = array
+            array = spilled
+        self._track(array, array.nbytes, isinstance(array, np.memmap))
+        return array
+
+    def _should_spill(self, nbytes):
+        with self._lock:
+            return self.ram_ceiling is not None and self.resident_bytes + nbytes > self.ram_ceiling
+
+    def _memmap(self, shape, dtype):
+        fd, path = tempfile.mkstemp(prefix="image-equalizer-", suffix=".bin", dir=self.scratch_dir)
+        os.close(fd)
+        array = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+        try:
+            os.unlink(path)  # The mapping stays valid; the space is freed when it is unmapped
+        except OSError:
+            weakref.finalize(array, _remove_file, path)
+        instrumentation.allocated("spill", array.nbytes)
+        instrumentation.log("Spilled a %.0f MB array to %s", array.nbytes / 2**20, os.path.dirname(path))
+        return array
+
+    def _track(self, array, nbytes, spilled):
+        with self._lock:
+            self._tracked[id(array)] = (nbytes, spilled)
+            if spilled:
+                self.spilled_bytes += nbytes
+            else:
+                self.resident_bytes += nbytes
+        weakref.finalize(array, self._release, id(array))
+
+    def _release(self, key):
+        with self._lock:
+            nbytes, spilled = self._tracked.pop(key)
+            if spilled:
+                self.spilled_bytes -= nbytes
+            else:
+                self.resident_bytes -= nbytes
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
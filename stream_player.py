@@ -0,0 +1,52 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from frame_stream import StreamMixer
+
+
+class StreamPlayer(QObject):
+    """Play a frame-sequence mix in the GUI.
+
+    Runs a StreamMixer and hands its frames and its end to the GUI thread as
+    signals. Anything still arriving from a stream that has been stopped or
+    replaced is dropped.
+    """
+
+    frame_ready = pyqtSignal(int, object)  # frame index, uint8 image
+    finished = pyqtSignal(object)          # the StreamMixer, for its counters and error
+
+    _frame = pyqtSignal(object, int, object)  # From the sink thread: stream, frame index, image
+    _finished = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.stream = None
+        self._frame.connect(self._relay_frame)
+        self._finished.connect(self._relay_finished)
+
+    def play(self, sequences, recipe, fps=None):
+        """Stop any current stream and start mixing sequences with recipe (see StreamMixer)."""
+        self.stop()
+        stream = StreamMixer(sequences, recipe,
+                             lambda index, image: self._frame.emit(stream, index, image),
+                             fps, lambda: self._finished.emit(stream))
+        self.stream = stream
+        stream.start()
+        return stream
+
+    def stop(self):
+        """Stop the current stream; its remaining frames and its end are not reported."""
+        stream, self.stream = self.stream, None
+        if stream is not None:
+            stream.stop()
+
+    def is_playing(self):
+        return self.stream is not None
+
+    def _relay_frame(self, stream, index, image):
+        if stream is self.stream:
+            self.frame_ready.emit(index, image)
+
+    def _relay_finished(self, stream):
+        if stream is self.stream:
+            self.stream = None
+            self.finished.emit(stream)
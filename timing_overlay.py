@@ -0,0 +1,53 @@
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtCore import Qt, QTimer
+
+import instrumentation
+
+REFRESH_MS = 500
+
+
+class TimingOverlay(QLabel):
+    """Semi-transparent table of the recorded timing spans, drawn over its parent widget.
+
+    With a workspace, its memory usage is shown below the table.
+    """
+
+    def __init__(self, parent, workspace=None):
+        super().__init__(parent)
+        self.workspace = workspace
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.setStyleSheet("""
+            QLabel{
+                font-family:monospace;
+                font-size:12px;
+                color:#9f9;
+                background-color:rgba(0, 0, 0, 190);
+                padding:8px;
+                    }
+        """)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def set_active(self, active):
+        """Show the overlay and record spans, or hide it and stop recording."""
+        instrumentation.enable(active)
+        if active:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+            self.hide()
+
+    def refresh(self):
+        """Redraw the table from the latest recorded spans."""
+        text = instrumentation.format_summary()
+        if self.workspace is not None:
+            text += "\n" + self.workspace.format_usage()
+        self.setText(text)
+        self.adjustSize()
+        self.move(10, 10)
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+import instrumentation
+
+
+class Workspace:
+    """Named scratch buffers that are reused from one call to the next.
+
+    A pipeline stage asks for its buffer by name, with the shape and dtype it
+    needs; the same name keeps returning the same array while they match, and
+    a new one (replacing the old) once they change. The contents of a buffer
+    are therefore only valid until its name is requested again: results that
+    outlive the call, or cross to another thread, must not live in one. Each
+    name must only be used from one thread.
+
+    current_bytes and peak_bytes track the memory held; usage() reports them
+    with the number of allocations and reuses. Buffers are made by
+    allocator(shape, dtype), np.empty by default; pass globals.spill.empty to
+    count them against the spill ceiling.
+    """
+
+    def __init__(self, allocator=np.empty):
+        self.allocator = allocator
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.peak_bytes = 0
+        self.allocations = 0
+        self.reuses = 0
+
+    def buffer(self, name, shape, dtype):
+        """Return the buffer called name with this shape and dtype; its contents are undefined."""
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is not None and buffer.shape == shape and buffer.dtype == dtype:
+                self.reuses += 1
+                return buffer
+            if buffer is not None:
+                self.current_bytes -= buffer.nbytes
+            buffer = self.allocator(shape, dtype)
+            self._buffers[name] = buffer
+            self.current_bytes += buffer.nbytes
+            self.peak_bytes = max(self.peak_bytes, self.current_bytes)
+            self.allocations += 1
+        instrumentation.allocated("workspace", buffer.nbytes)
+        return buffer
+
+    def release(self, name=None):
+        """Drop the buffer called name, or every buffer."""
+        with self._lock:
+            names = list(self._buffers) if name is None else [name]
+            for name in names:
+                buffer = self._buffers.pop(name, None)
+                if buffer is not None:
+                    self.current_bytes -= buffer.nbytes
+
+    def usage(self):
+        """Return {"current_bytes", "peak_bytes", "buffers", "allocations", "reuses"}."""
+        with self._lock:
+            return {
+                "current_bytes": self.current_bytes,
+                "peak_bytes": self.peak_bytes,
+                "buffers": len(self._buffers),
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+            }
+
+    def format_usage(self):
+        """One-line summary of usage() for display."""
+        usage = self.usage()
+        return (f"workspace: {usage['current_bytes'] / 2**20:.1f} MB in {usage['buffers']} buffers, "
+                f"peak {usage['peak_bytes'] / 2**20:.1f} MB, "
+                f"{usage['allocations']} allocations / {usage['reuses']} reuses")